@@ -0,0 +1,30 @@
+from typing import Optional
+import redis.asyncio as redis
+
+from app.config import get_settings
+
+settings = get_settings()
+
+_redis: Optional[redis.Redis] = None
+
+
+async def init_redis():
+    """Open the shared Redis connection pool (caching is disabled if Redis is unreachable)"""
+    global _redis
+    try:
+        client = redis.from_url(settings.redis_url, decode_responses=False)
+        await client.ping()
+    except Exception:
+        client = None
+    _redis = client
+
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+def get_redis() -> Optional[redis.Redis]:
+    return _redis
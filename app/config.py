@@ -1,6 +1,9 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
 
 class Settings(BaseSettings):
     # App
@@ -22,18 +25,29 @@ class Settings(BaseSettings):
     # Scheduler
     weekly_refresh_day: str = "sunday"
     weekly_refresh_hour: int = 3
+    refresh_concurrency: int = 4
 
     # Rate limiting
     github_requests_per_hour: int = 5000
     max_stargazers_sample: int = 100
     max_similar_users: int = 50
 
+    @field_validator("weekly_refresh_day")
+    @classmethod
+    def check_weekly_refresh_day(cls, value: str) -> str:
+        """Accept a day name or its three-letter abbreviation, in any case"""
+        day = value.strip().lower()
+        for weekday in WEEKDAYS:
+            if day in (weekday, weekday[:3]):
+                return weekday
+        raise ValueError(f"must be a day of the week like 'sunday' or 'sun', got {value!r}")
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
-@lru_cache
+@lru_cache(maxsize=None)
 def get_settings() -> Settings:
     return Settings()
 
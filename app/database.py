@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 import os
@@ -6,7 +7,32 @@ import os
 DATABASE_PATH = os.getenv("DATABASE_PATH", "/app/data/stardiscover.db")
 DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=20,
+    max_overflow=20,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    connect_args={"timeout": 30},
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, connection_record):
+    # WAL lets dashboard reads proceed while a sync task is writing
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
@@ -22,6 +48,40 @@ async def get_db():
             await session.close()
 
 
+def _add_missing_columns(sync_conn):
+    # create_all doesn't alter existing tables, so add any new nullable columns here
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=sync_conn.dialect)
+                sync_conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                )
+
+
+def _fail_stale_jobs(sync_conn):
+    # Jobs run as in-process tasks, so anything still "running" at startup was interrupted
+    sync_conn.exec_driver_sql(
+        "UPDATE job_status SET status = 'failed', message = 'Interrupted by a restart', "
+        "completed_at = CURRENT_TIMESTAMP WHERE status = 'running'"
+    )
+    # Replaced by ix_job_sync_running_unique, which only covers star syncs
+    sync_conn.exec_driver_sql("DROP INDEX IF EXISTS ix_job_running_unique")
+
+
+def _create_missing_indexes(sync_conn):
+    # create_all skips tables that already exist, so add any new indexes here
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_fail_stale_jobs)
+        await conn.run_sync(_create_missing_indexes)
+        await conn.exec_driver_sql("ANALYZE")
@@ -0,0 +1,52 @@
+from typing import Optional
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db
+from app.models import User
+from app.services.user_cache import UserView, load_user_view, get_cached_user, cache_user
+
+
+async def get_current_user(
+    request: Request, db: AsyncSession = Depends(get_db)
+) -> Optional[UserView]:
+    """Resolve the session user, or None when not logged in"""
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return None
+
+    cached = await get_cached_user(user_id)
+    if cached:
+        return cached
+
+    user = await load_user_view(db, user_id)
+    if user:
+        await cache_user(user)
+    return user
+
+
+async def require_user(
+    request: Request, user: Optional[UserView] = Depends(get_current_user)
+) -> UserView:
+    """Resolve the session user, raising 401/404 for API routes"""
+    if not request.session.get("user_id"):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+async def require_user_with_token(
+    request: Request, db: AsyncSession = Depends(get_db)
+) -> User:
+    """Load the full User row, for handlers that need the GitHub access token"""
+    user_id = request.session.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
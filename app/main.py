@@ -1,18 +1,25 @@
 from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI, Request, Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from starlette.middleware.sessions import SessionMiddleware
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+import httpx
 import os
+import tempfile
 import logging
 
 from app.config import get_settings
-from app.database import init_db, get_db, async_session
+from app.database import init_db
+from app.cache import init_redis, close_redis
+from app.services.github_client import close_github_http
+from app.services.llm_client import close_llm_client
 from app.routers import auth, github, recommendations
-from app.models import User
+from app.dependencies import get_current_user
+from app.services.user_cache import UserView
 from app.tasks.scheduler import start_scheduler, stop_scheduler
-from sqlalchemy import select
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,12 +30,22 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting StarDiscover...")
     await init_db()
+    await init_redis()
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=10.0,
+        limits=httpx.Limits(max_keepalive_connections=20),
+    )
     start_scheduler()
     logger.info("StarDiscover started successfully")
     yield
     # Shutdown
     logger.info("Shutting down StarDiscover...")
     stop_scheduler()
+    await app.state.http.aclose()
+    await close_github_http()
+    await close_llm_client()
+    await close_redis()
 
 
 app = FastAPI(
@@ -48,7 +65,17 @@ static_path = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_path):
     app.mount("/static", StaticFiles(directory=static_path), name="static")
 
-templates = Jinja2Templates(directory=templates_path)
+# Compiled templates are cached on disk so restarts skip re-parsing
+jinja_cache_path = os.path.join(tempfile.gettempdir(), "stardiscover_jinja")
+os.makedirs(jinja_cache_path, exist_ok=True)
+
+jinja_env = Environment(
+    loader=FileSystemLoader(templates_path),
+    autoescape=True,
+    auto_reload=settings.debug,
+    bytecode_cache=FileSystemBytecodeCache(jinja_cache_path),
+)
+templates = Jinja2Templates(env=jinja_env)
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -56,31 +83,30 @@ app.include_router(github.router, prefix="/api/github", tags=["github"])
 app.include_router(recommendations.router, prefix="/api/recommendations", tags=["recommendations"])
 
 
-async def get_current_user(request: Request):
-    user_id = request.session.get("user_id")
-    if not user_id:
-        return None
-    async with async_session() as db:
-        result = await db.execute(select(User).where(User.id == user_id))
-        return result.scalar_one_or_none()
-
-
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request):
-    user = await get_current_user(request)
+async def dashboard(request: Request, user: Optional[UserView] = Depends(get_current_user)):
     if not user:
         return templates.TemplateResponse("login.html", {"request": request})
     return templates.TemplateResponse("dashboard.html", {"request": request, "user": user})
 
 
 @app.get("/recommendations", response_class=HTMLResponse)
-async def recommendations_page(request: Request):
-    user = await get_current_user(request)
+async def recommendations_page(
+    request: Request, user: Optional[UserView] = Depends(get_current_user)
+):
     if not user:
         return RedirectResponse(url="/auth/login")
     return templates.TemplateResponse("recommendations.html", {"request": request, "user": user})
 
 
+# Pre-serialized so liveness probes skip dict allocation and JSON encoding
+_HEALTH_RESPONSE = Response(
+    content=b'{"status":"healthy","service":"stardiscover"}',
+    media_type="application/json",
+    headers={"Cache-Control": "no-store"},
+)
+
+
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "service": "stardiscover"}
+    return _HEALTH_RESPONSE
@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, UniqueConstraint
-from sqlalchemy.sql import func
+from sqlalchemy import (
+    Column, Integer, String, Text, DateTime, Float, ForeignKey, UniqueConstraint, Index
+)
+from sqlalchemy.sql import func, text
 from app.database import Base
+from app.models.types import JSONText
 
 
 class SimilarUser(Base):
@@ -27,17 +30,19 @@ class Recommendation(Base):
     github_repo_id = Column(Integer, nullable=False)
     full_name = Column(String(255), nullable=False)
     description = Column(Text)
-    topics = Column(Text)  # JSON array
+    topics = Column(JSONText)
     language = Column(String(100))
     stars_count = Column(Integer)
     relevance_score = Column(Float, nullable=False)
     explanation = Column(Text)
-    source_users = Column(Text)  # JSON array of usernames
+    source_users = Column(JSONText)  # Usernames of the similar users who starred it
     batch_id = Column(String(36), nullable=False)
     created_at = Column(DateTime, server_default=func.now())
 
     __table_args__ = (
         UniqueConstraint("user_id", "github_repo_id", "batch_id", name="uq_recommendations"),
+        Index("ix_recs_user_batch_score", "user_id", "batch_id", relevance_score.desc()),
+        Index("ix_recs_user_created", "user_id", created_at.desc()),
     )
 
 
@@ -67,3 +72,15 @@ class JobStatus(Base):
     started_at = Column(DateTime)
     completed_at = Column(DateTime)
     created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_job_user_type_created", "user_id", "job_type", "created_at"),
+        Index("ix_job_running", "user_id", "job_type", "status"),
+        # At most one running star sync per user; /sync-stars relies on the IntegrityError
+        Index(
+            "ix_job_sync_running_unique",
+            "user_id",
+            unique=True,
+            sqlite_where=text("job_type = 'sync_stars' AND status = 'running'"),
+        ),
+    )
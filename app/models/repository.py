@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from app.database import Base
+from app.models.types import JSONText
 
 
 class StarredRepo(Base):
@@ -11,7 +12,7 @@ class StarredRepo(Base):
     github_repo_id = Column(Integer, nullable=False)
     full_name = Column(String(255), nullable=False)
     description = Column(Text)
-    topics = Column(Text)  # JSON array
+    topics = Column(JSONText)
     readme_summary = Column(Text)
     language = Column(String(100))
     stars_count = Column(Integer)
@@ -21,6 +22,7 @@ class StarredRepo(Base):
 
     __table_args__ = (
         UniqueConstraint("user_id", "github_repo_id", name="uq_starred_repos_user_repo"),
+        Index("ix_starred_user_stars", "user_id", "stars_count"),
     )
 
 
@@ -32,12 +34,14 @@ class CandidateRepo(Base):
     github_repo_id = Column(Integer, nullable=False)
     full_name = Column(String(255), nullable=False)
     description = Column(Text)
-    topics = Column(Text)  # JSON array
+    topics = Column(JSONText)
     language = Column(String(100))
     stars_count = Column(Integer)
     source_count = Column(Integer, default=1)  # How many similar users starred this
+    source_users = Column(JSONText)  # Usernames of the similar users who starred it
     discovered_at = Column(DateTime, server_default=func.now())
 
     __table_args__ = (
         UniqueConstraint("user_id", "github_repo_id", name="uq_candidate_repos_user_repo"),
+        Index("ix_candidate_user_source", "user_id", source_count.desc()),
     )
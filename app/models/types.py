@@ -0,0 +1,19 @@
+from sqlalchemy import Text
+from sqlalchemy.types import TypeDecorator
+
+from app.util import jsonx
+
+
+class JSONText(TypeDecorator):
+    """JSON array stored as TEXT, encoded/decoded once at the driver boundary"""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return jsonx.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        return jsonx.loads(value) if value else []
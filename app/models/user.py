@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.orm import column_property
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -15,5 +16,9 @@ class User(Base):
     token_expires_at = Column(DateTime)
     taste_profile = Column(Text)  # JSON string
     taste_profile_updated_at = Column(DateTime)
+    # Hash of the starred repos similar users were last computed from
+    starred_fingerprint = Column(String(32))
+    # Computed in SQL so presence checks never read the taste_profile text
+    has_taste_profile = column_property(taste_profile.is_not(None))
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
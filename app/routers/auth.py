@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, Depends
 from fastapi.responses import RedirectResponse
-import httpx
 from sqlalchemy import select
+from urllib.parse import urlencode
 
 from app.config import get_settings
 from app.database import async_session
 from app.models import User
+from app.dependencies import require_user
+from app.schemas import CurrentUserResponse
+from app.services.user_cache import UserView, invalidate_user
 
 router = APIRouter()
 settings = get_settings()
@@ -15,16 +18,20 @@ GITHUB_TOKEN_URL = "https://github.com/login/oauth/access_token"
 GITHUB_USER_URL = "https://api.github.com/user"
 
 
-@router.get("/login")
-async def login():
-    """Redirect to GitHub OAuth"""
-    params = {
+# Settings are fixed for the life of the process, so build the redirect once
+_AUTHORIZE_URL = f"{GITHUB_AUTHORIZE_URL}?" + urlencode(
+    {
         "client_id": settings.github_client_id,
         "redirect_uri": settings.github_redirect_uri,
         "scope": "read:user",
     }
-    url = f"{GITHUB_AUTHORIZE_URL}?" + "&".join(f"{k}={v}" for k, v in params.items())
-    return RedirectResponse(url=url)
+)
+
+
+@router.get("/login")
+async def login():
+    """Redirect to GitHub OAuth"""
+    return RedirectResponse(url=_AUTHORIZE_URL)
 
 
 @router.get("/callback")
@@ -36,41 +43,41 @@ async def callback(request: Request, code: str = None, error: str = None):
     if not code:
         raise HTTPException(status_code=400, detail="No authorization code received")
 
-    # Exchange code for access token
-    async with httpx.AsyncClient() as client:
-        token_response = await client.post(
-            GITHUB_TOKEN_URL,
-            data={
-                "client_id": settings.github_client_id,
-                "client_secret": settings.github_client_secret,
-                "code": code,
-                "redirect_uri": settings.github_redirect_uri,
-            },
-            headers={"Accept": "application/json"},
-        )
-
-        if token_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get access token")
-
-        token_data = token_response.json()
-        access_token = token_data.get("access_token")
-
-        if not access_token:
-            raise HTTPException(status_code=400, detail="No access token in response")
-
-        # Get user info
-        user_response = await client.get(
-            GITHUB_USER_URL,
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/vnd.github.v3+json",
-            },
-        )
-
-        if user_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get user info")
-
-        user_data = user_response.json()
+    # Exchange code for access token (shared keep-alive client from app lifespan)
+    client = request.app.state.http
+    token_response = await client.post(
+        GITHUB_TOKEN_URL,
+        data={
+            "client_id": settings.github_client_id,
+            "client_secret": settings.github_client_secret,
+            "code": code,
+            "redirect_uri": settings.github_redirect_uri,
+        },
+        headers={"Accept": "application/json"},
+    )
+
+    if token_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get access token")
+
+    token_data = token_response.json()
+    access_token = token_data.get("access_token")
+
+    if not access_token:
+        raise HTTPException(status_code=400, detail="No access token in response")
+
+    # Get user info
+    user_response = await client.get(
+        GITHUB_USER_URL,
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/vnd.github.v3+json",
+        },
+    )
+
+    if user_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get user info")
+
+    user_data = user_response.json()
 
     # Create or update user in database
     async with async_session() as db:
@@ -94,6 +101,7 @@ async def callback(request: Request, code: str = None, error: str = None):
 
         await db.commit()
         await db.refresh(user)
+        await invalidate_user(user.id)
 
         # Store user ID in session
         request.session["user_id"] = user.id
@@ -104,28 +112,14 @@ async def callback(request: Request, code: str = None, error: str = None):
 @router.post("/logout")
 async def logout(request: Request):
     """Clear session"""
+    user_id = request.session.get("user_id")
+    if user_id:
+        await invalidate_user(user_id)
     request.session.clear()
     return RedirectResponse(url="/", status_code=303)
 
 
-@router.get("/me")
-async def me(request: Request):
+@router.get("/me", response_model=CurrentUserResponse)
+async def me(user: UserView = Depends(require_user)):
     """Get current user info"""
-    user_id = request.session.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    async with async_session() as db:
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        return {
-            "id": user.id,
-            "github_id": user.github_id,
-            "github_username": user.github_username,
-            "github_avatar_url": user.github_avatar_url,
-            "has_taste_profile": user.taste_profile is not None,
-        }
+    return user._asdict()
@@ -1,119 +1,85 @@
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
-from sqlalchemy import select, delete
-from datetime import datetime
-import json
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from typing import List
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.exc import IntegrityError
 
 from app.database import async_session
 from app.models import User, StarredRepo, JobStatus
+from app.dependencies import require_user, require_user_with_token
+from app.schemas import StarredRepoResponse, SyncStatusResponse
+from app.services.user_cache import UserView
 from app.services.github_client import get_github_client
+from app.services.starred_sync import sync_starred_repos
 
 router = APIRouter()
 
 
-async def get_user_from_session(request: Request) -> User:
-    user_id = request.session.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    async with async_session() as db:
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
-
-
-async def sync_starred_repos_task(user_id: int, access_token: str):
+async def sync_starred_repos_task(job_id: int, user_id: int, access_token: str):
     """Background task to sync starred repos"""
-    async with async_session() as db:
-        # Create job status
-        job = JobStatus(
-            user_id=user_id,
-            job_type="sync_stars",
-            status="running",
-            progress=0,
-            started_at=datetime.utcnow(),
-        )
-        db.add(job)
-        await db.commit()
-        await db.refresh(job)
-        job_id = job.id
-
     try:
         client = await get_github_client(access_token)
         repos = await client.get_starred_repos()
 
+        # Apply the sync in a single transaction so it costs one commit
         async with async_session() as db:
-            # Update progress
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 50
-            job.message = f"Found {len(repos)} starred repos"
-            await db.commit()
-
-            # Delete old starred repos
-            await db.execute(delete(StarredRepo).where(StarredRepo.user_id == user_id))
-
-            # Insert new starred repos
-            for repo in repos:
-                starred_repo = StarredRepo(
-                    user_id=user_id,
-                    github_repo_id=repo["id"],
-                    full_name=repo["full_name"],
-                    description=repo.get("description"),
-                    topics=json.dumps(repo.get("topics", [])),
-                    language=repo.get("language"),
-                    stars_count=repo.get("stargazers_count"),
-                    forks_count=repo.get("forks_count"),
+            async with db.begin():
+                await sync_starred_repos(db, user_id, repos)
+
+                # Update job status
+                await db.execute(
+                    update(JobStatus)
+                    .where(JobStatus.id == job_id)
+                    .values(
+                        status="completed",
+                        progress=100,
+                        message=f"Synced {len(repos)} starred repos",
+                        completed_at=func.now(),
+                    )
                 )
-                db.add(starred_repo)
-
-            # Update job status
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.status = "completed"
-            job.progress = 100
-            job.message = f"Synced {len(repos)} starred repos"
-            job.completed_at = datetime.utcnow()
-            await db.commit()
 
     except Exception as e:
         async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.status = "failed"
-            job.message = str(e)
-            job.completed_at = datetime.utcnow()
+            await db.execute(
+                update(JobStatus)
+                .where(JobStatus.id == job_id)
+                .values(status="failed", message=str(e), completed_at=func.now())
+            )
             await db.commit()
 
 
 @router.post("/sync-stars")
-async def sync_stars(request: Request, background_tasks: BackgroundTasks):
+async def sync_stars(
+    background_tasks: BackgroundTasks, user: User = Depends(require_user_with_token)
+):
     """Trigger sync of starred repositories"""
-    user = await get_user_from_session(request)
 
-    # Check if there's already a running sync
+    # Create the job row; the partial unique index rejects a second running sync
     async with async_session() as db:
-        result = await db.execute(
-            select(JobStatus).where(
-                JobStatus.user_id == user.id,
-                JobStatus.job_type == "sync_stars",
-                JobStatus.status == "running",
+        try:
+            result = await db.execute(
+                insert(JobStatus)
+                .values(
+                    user_id=user.id,
+                    job_type="sync_stars",
+                    status="running",
+                    progress=0,
+                    started_at=func.now(),
+                )
+                .returning(JobStatus.id)
             )
-        )
-        existing = result.scalar_one_or_none()
-        if existing:
+            job_id = result.scalar_one()
+            await db.commit()
+        except IntegrityError:
             raise HTTPException(status_code=400, detail="Sync already in progress")
 
-    background_tasks.add_task(sync_starred_repos_task, user.id, user.access_token)
+    background_tasks.add_task(sync_starred_repos_task, job_id, user.id, user.access_token)
     return {"message": "Sync started", "status": "running"}
 
 
-@router.get("/sync-status")
-async def sync_status(request: Request):
+# exclude_unset keeps the no_sync reply to just status and message
+@router.get("/sync-status", response_model=SyncStatusResponse, response_model_exclude_unset=True)
+async def sync_status(user: UserView = Depends(require_user)):
     """Get status of the most recent sync job"""
-    user = await get_user_from_session(request)
-
     async with async_session() as db:
         result = await db.execute(
             select(JobStatus)
@@ -135,38 +101,34 @@ async def sync_status(request: Request):
         }
 
 
-@router.get("/starred")
-async def get_starred(request: Request, limit: int = 100, offset: int = 0):
+@router.get("/starred", response_model=List[StarredRepoResponse])
+async def get_starred(
+    limit: int = 100, offset: int = 0, user: UserView = Depends(require_user)
+):
     """Get cached starred repositories"""
-    user = await get_user_from_session(request)
-
     async with async_session() as db:
+        # Column projection skips ORM entity construction for this read-only list
         result = await db.execute(
-            select(StarredRepo)
+            select(
+                StarredRepo.id,
+                StarredRepo.github_repo_id,
+                StarredRepo.full_name,
+                StarredRepo.description,
+                StarredRepo.topics,
+                StarredRepo.language,
+                StarredRepo.stars_count,
+                StarredRepo.starred_at,
+            )
             .where(StarredRepo.user_id == user.id)
             .order_by(StarredRepo.stars_count.desc())
             .limit(limit)
             .offset(offset)
         )
-        repos = result.scalars().all()
-
-        return [
-            {
-                "id": repo.id,
-                "github_repo_id": repo.github_repo_id,
-                "full_name": repo.full_name,
-                "description": repo.description,
-                "topics": json.loads(repo.topics) if repo.topics else [],
-                "language": repo.language,
-                "stars_count": repo.stars_count,
-            }
-            for repo in repos
-        ]
+        return result.mappings().all()
 
 
 @router.get("/rate-limit")
-async def rate_limit(request: Request):
+async def rate_limit(user: User = Depends(require_user_with_token)):
     """Check GitHub API rate limit"""
-    user = await get_user_from_session(request)
     client = await get_github_client(user.access_token)
     return await client.get_rate_limit()
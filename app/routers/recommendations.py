@@ -1,141 +1,121 @@
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
-from sqlalchemy import select, delete, func
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+import asyncio
+import contextlib
+from typing import List
+from sqlalchemy import select, delete, func, insert, and_, exists
 from datetime import datetime
-import json
 
 from app.database import async_session
 from app.models import User, StarredRepo, Recommendation, Feedback, JobStatus
+from app.dependencies import require_user, require_user_with_token
+from app.schemas import RecommendationResponse
+from app.services.user_cache import UserView
 from app.services.profile_analyzer import build_taste_profile
-from app.services.similar_users import discover_similar_users, gather_candidate_repos
-from app.services.recommendation_engine import generate_recommendations
+from app.services.similar_users import (
+    discover_similar_users,
+    gather_candidate_repos,
+    load_starred_repo_ids,
+)
+from app.services.recommendation_engine import (
+    generate_recommendations,
+    generate_profile_and_recommendations,
+)
+from app.services.jobs import update_job
+from app.util import jsonx
 
 router = APIRouter()
 
 
-async def get_user_from_session(request: Request) -> User:
-    user_id = request.session.get("user_id")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    async with async_session() as db:
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
-
-
 async def full_recommendation_pipeline(user_id: int, access_token: str):
     """Background task running the complete recommendation pipeline"""
     async with async_session() as db:
-        job = JobStatus(
-            user_id=user_id,
-            job_type="generate_recs",
-            status="running",
-            progress=0,
-            message="Starting recommendation pipeline...",
-            started_at=datetime.utcnow(),
+        result = await db.execute(
+            insert(JobStatus)
+            .values(
+                user_id=user_id,
+                job_type="generate_recs",
+                status="running",
+                progress=0,
+                message="Starting recommendation pipeline...",
+                started_at=datetime.utcnow(),
+            )
+            .returning(JobStatus.id)
         )
-        db.add(job)
+        job_id = result.scalar_one()
         await db.commit()
-        await db.refresh(job)
-        job_id = job.id
+
+    # Starred repo IDs are only needed in step 2, so load them while step 1 runs
+    starred_ids_task = asyncio.create_task(load_starred_repo_ids(user_id))
 
     try:
-        # Step 1: Build taste profile (10-30%)
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 10
-            job.message = "Analyzing your starred repos..."
-            await db.commit()
-
-        await build_taste_profile(user_id)
-
-        # Step 2: Find similar users (30-60%)
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 30
-            job.message = "Finding users with similar taste..."
-            await db.commit()
+        # Step 1: Find similar users (10-40%)
+        await update_job(job_id, progress=10, message="Finding users with similar taste...")
 
         await discover_similar_users(user_id, access_token)
 
-        # Step 3: Discover candidate repos (60-80%)
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 60
-            job.message = "Discovering candidate repositories..."
-            await db.commit()
-
-        # Get user's starred repo IDs to exclude from candidates
-        async with async_session() as db:
-            result = await db.execute(select(StarredRepo.github_repo_id).where(StarredRepo.user_id == user_id))
-            starred_ids = set(r[0] for r in result.all())
+        # Step 2: Discover candidate repos (40-70%)
+        await update_job(job_id, progress=40, message="Discovering candidate repositories...")
+
+        # Exclude the user's own starred repos from candidates
+        starred_ids = await starred_ids_task
         await gather_candidate_repos(user_id, access_token, starred_ids)
 
-        # Step 4: Score and rank (80-100%)
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 80
-            job.message = "Scoring recommendations with AI..."
-            await db.commit()
+        # Step 3: Build taste profile and score (70-100%), in one LLM call when the inputs fit
+        await update_job(job_id, progress=70, message="Analyzing your starred repos...")
+
+        recommendations = await generate_profile_and_recommendations(user_id)
+        if recommendations is None:
+            await build_taste_profile(user_id)
 
-        recommendations = await generate_recommendations(user_id)
+            await update_job(job_id, progress=85, message="Scoring recommendations with AI...")
+
+            recommendations = await generate_recommendations(user_id)
 
         # Complete
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.status = "completed"
-            job.progress = 100
-            job.message = f"Generated {len(recommendations)} recommendations!"
-            job.completed_at = datetime.utcnow()
-            await db.commit()
+        await update_job(
+            job_id,
+            progress=100,
+            message=f"Generated {len(recommendations)} recommendations!",
+            status="completed",
+        )
 
     except Exception as e:
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.status = "failed"
-            job.message = str(e)
-            job.completed_at = datetime.utcnow()
-            await db.commit()
+        starred_ids_task.cancel()
+        # Retrieve the task's outcome so a failure there isn't logged as never retrieved
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await starred_ids_task
+        await update_job(job_id, message=str(e), status="failed")
 
 
 @router.post("/generate")
-async def generate(request: Request, background_tasks: BackgroundTasks):
+async def generate(
+    background_tasks: BackgroundTasks, user: User = Depends(require_user_with_token)
+):
     """Start the full recommendation generation pipeline"""
-    user = await get_user_from_session(request)
 
-    # Check starred repos exist
+    # Check starred repos exist and no pipeline is already running, in one round-trip
     async with async_session() as db:
         result = await db.execute(
-            select(func.count(StarredRepo.id)).where(StarredRepo.user_id == user.id)
-        )
-        count = result.scalar()
-        if count == 0:
-            raise HTTPException(
-                status_code=400,
-                detail="No starred repos found. Please sync your stars first.",
+            select(
+                exists().where(StarredRepo.user_id == user.id),
+                exists().where(
+                    JobStatus.user_id == user.id,
+                    JobStatus.job_type == "generate_recs",
+                    JobStatus.status == "running",
+                ),
             )
+        )
+        has_stars, is_running = result.one()
 
-        # Check if pipeline is already running
-        result = await db.execute(
-            select(JobStatus).where(
-                JobStatus.user_id == user.id,
-                JobStatus.job_type == "generate_recs",
-                JobStatus.status == "running",
-            )
+    if not has_stars:
+        raise HTTPException(
+            status_code=400,
+            detail="No starred repos found. Please sync your stars first.",
+        )
+    if is_running:
+        raise HTTPException(
+            status_code=400, detail="Recommendation generation already in progress"
         )
-        existing = result.scalar_one_or_none()
-        if existing:
-            raise HTTPException(
-                status_code=400, detail="Recommendation generation already in progress"
-            )
 
     background_tasks.add_task(
         full_recommendation_pipeline, user.id, user.access_token
@@ -144,10 +124,8 @@ async def generate(request: Request, background_tasks: BackgroundTasks):
 
 
 @router.get("/status")
-async def status(request: Request):
+async def status(user: UserView = Depends(require_user)):
     """Get status of the most recent recommendation job"""
-    user = await get_user_from_session(request)
-
     async with async_session() as db:
         result = await db.execute(
             select(JobStatus)
@@ -169,30 +147,40 @@ async def status(request: Request):
         }
 
 
-@router.get("")
+@router.get("", response_model=List[RecommendationResponse])
 async def list_recommendations(
-    request: Request, limit: int = 20, offset: int = 0, batch_id: str = None
+    limit: int = 20,
+    offset: int = 0,
+    batch_id: str = None,
+    user: UserView = Depends(require_user),
 ):
     """Get recommendations for the current user"""
-    user = await get_user_from_session(request)
-
     async with async_session() as db:
-        query = select(Recommendation).where(Recommendation.user_id == user.id)
+        # Outer-join the user's feedback so each row carries it without a second query
+        query = (
+            select(Recommendation, Feedback.feedback_type)
+            .outerjoin(
+                Feedback,
+                and_(
+                    Feedback.recommendation_id == Recommendation.id,
+                    Feedback.user_id == user.id,
+                ),
+            )
+            .where(Recommendation.user_id == user.id)
+        )
 
         if batch_id:
             query = query.where(Recommendation.batch_id == batch_id)
         else:
-            # Get the most recent batch
-            subq = (
+            # Restrict to the most recent batch, resolved inside the same query
+            latest_batch = (
                 select(Recommendation.batch_id)
                 .where(Recommendation.user_id == user.id)
                 .order_by(Recommendation.created_at.desc())
                 .limit(1)
+                .scalar_subquery()
             )
-            result = await db.execute(subq)
-            latest_batch = result.scalar()
-            if latest_batch:
-                query = query.where(Recommendation.batch_id == latest_batch)
+            query = query.where(Recommendation.batch_id == latest_batch)
 
         query = (
             query.order_by(Recommendation.relevance_score.desc())
@@ -201,43 +189,32 @@ async def list_recommendations(
         )
 
         result = await db.execute(query)
-        recommendations = result.scalars().all()
-
-        # Get feedback for these recommendations
-        rec_ids = [r.id for r in recommendations]
-        feedback_result = await db.execute(
-            select(Feedback).where(
-                Feedback.user_id == user.id, Feedback.recommendation_id.in_(rec_ids)
-            )
-        )
-        feedback_map = {f.recommendation_id: f.feedback_type for f in feedback_result.scalars().all()}
 
         return [
-            {
-                "id": rec.id,
-                "github_repo_id": rec.github_repo_id,
-                "full_name": rec.full_name,
-                "description": rec.description,
-                "topics": json.loads(rec.topics) if rec.topics else [],
-                "language": rec.language,
-                "stars_count": rec.stars_count,
-                "relevance_score": rec.relevance_score,
-                "explanation": rec.explanation,
-                "batch_id": rec.batch_id,
-                "created_at": rec.created_at,
-                "feedback": feedback_map.get(rec.id),
-            }
-            for rec in recommendations
+            RecommendationResponse(
+                id=rec.id,
+                github_repo_id=rec.github_repo_id,
+                full_name=rec.full_name,
+                description=rec.description,
+                topics=rec.topics,
+                language=rec.language,
+                stars_count=rec.stars_count,
+                relevance_score=rec.relevance_score,
+                explanation=rec.explanation,
+                source_users=rec.source_users,
+                batch_id=rec.batch_id,
+                created_at=rec.created_at,
+                feedback=feedback_type,
+            )
+            for rec, feedback_type in result.all()
         ]
 
 
 @router.post("/{recommendation_id}/feedback")
 async def submit_feedback(
-    request: Request, recommendation_id: int, feedback_type: str
+    recommendation_id: int, feedback_type: str, user: UserView = Depends(require_user)
 ):
     """Submit feedback on a recommendation"""
-    user = await get_user_from_session(request)
-
     if feedback_type not in ("thumbs_up", "thumbs_down", "dismiss"):
         raise HTTPException(status_code=400, detail="Invalid feedback type")
 
@@ -278,20 +255,23 @@ async def submit_feedback(
 
 
 @router.get("/profile")
-async def get_profile(request: Request):
+async def get_profile(user: UserView = Depends(require_user)):
     """Get the user's taste profile"""
-    user = await get_user_from_session(request)
-
-    if not user.taste_profile:
+    if not user.has_taste_profile:
         return {"profile": None, "message": "No taste profile generated yet"}
 
-    return {"profile": json.loads(user.taste_profile)}
+    async with async_session() as db:
+        result = await db.execute(select(User.taste_profile).where(User.id == user.id))
+        taste_profile = result.scalar_one()
+
+    return {"profile": jsonx.loads(taste_profile)}
 
 
 @router.post("/profile/analyze")
-async def trigger_profile_analysis(request: Request, background_tasks: BackgroundTasks):
+async def trigger_profile_analysis(
+    background_tasks: BackgroundTasks, user: UserView = Depends(require_user)
+):
     """Trigger taste profile analysis"""
-    user = await get_user_from_session(request)
 
     # Check starred repos exist
     async with async_session() as db:
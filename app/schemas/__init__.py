@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
 from datetime import datetime
 
@@ -12,8 +12,15 @@ class UserResponse(BaseModel):
     taste_profile_updated_at: Optional[datetime]
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+class CurrentUserResponse(BaseModel):
+    id: int
+    github_id: int
+    github_username: str
+    github_avatar_url: Optional[str]
+    has_taste_profile: bool
 
 
 class RepoBase(BaseModel):
@@ -29,8 +36,7 @@ class StarredRepoResponse(RepoBase):
     id: int
     starred_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class RecommendationResponse(BaseModel):
@@ -43,11 +49,12 @@ class RecommendationResponse(BaseModel):
     stars_count: Optional[int]
     relevance_score: float
     explanation: Optional[str]
-    source_users: Optional[List[str]]
+    source_users: Optional[List[str]] = None
+    batch_id: str
     created_at: datetime
+    feedback: Optional[str] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class JobStatusResponse(BaseModel):
@@ -59,8 +66,15 @@ class JobStatusResponse(BaseModel):
     started_at: Optional[datetime]
     completed_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+
+class SyncStatusResponse(BaseModel):
+    status: str
+    progress: Optional[int] = None
+    message: Optional[str] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
 
 
 class TasteProfile(BaseModel):
@@ -1,22 +1,142 @@
 import httpx
 import asyncio
-from typing import Optional, List, Dict, Any
-from tenacity import retry, stop_after_attempt, wait_exponential
-import json
+import hashlib
+from functools import lru_cache
+from typing import Callable, Optional, List, Dict, Any, Set, Tuple
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+    RetryCallState,
+)
 from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
 import redis.asyncio as redis
 
+from app.cache import get_redis
 from app.config import get_settings
+from app.util import jsonx
 
 settings = get_settings()
 
 GITHUB_API_BASE = "https://api.github.com"
+GRAPHQL_URL = f"{GITHUB_API_BASE}/graphql"
+PAGE_CONCURRENCY = 10  # Parallel page fetches, kept low for GitHub's secondary rate limits
+GRAPHQL_BATCH_SIZE = 25  # Aliased lookups per GraphQL query, well inside GitHub's node limits
+
+STARRED_REPO_FIELDS = """
+pageInfo { hasNextPage endCursor }
+nodes {
+  databaseId nameWithOwner description stargazerCount
+  primaryLanguage { name }
+  repositoryTopics(first: 20) { nodes { topic { name } } }
+}"""
+
+RATE_LIMIT_MAX_WAIT = 3600  # Don't wait more than an hour for a rate limit reset
+ETAG_CACHE_TTL = 691200  # 8 days, just past the weekly refresh interval
+
+
+class RateLimited(Exception):
+    """GitHub rate limit exhausted; retried after the reset time"""
+
+    def __init__(self, wait_seconds: float):
+        super().__init__(f"GitHub rate limit exceeded, retrying in {wait_seconds:.0f}s")
+        self.wait_seconds = wait_seconds
+
+
+class GraphQLError(Exception):
+    """GraphQL query failed as a whole (e.g. RATE_LIMITED), even though the HTTP status was 200"""
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (RateLimited, httpx.TransportError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return False
+
+
+_backoff = wait_exponential_jitter(initial=1, max=60)
+
+
+def _retry_wait(retry_state: RetryCallState) -> float:
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, RateLimited):
+        return exc.wait_seconds
+    return _backoff(retry_state)
+
+
+# Connection pool shared by every GitHubClient; auth headers are sent per request
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _http_client
+
+
+async def close_github_http():
+    global _http_client
+    _client_for_token.cache_clear()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _chunks(items: list, size: int) -> List[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _repo_from_graphql(node: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a GraphQL Repository node to the REST field names the rest of the app uses"""
+    return {
+        "id": node["databaseId"],
+        "full_name": node["nameWithOwner"],
+        "description": node.get("description"),
+        "topics": [t["topic"]["name"] for t in node["repositoryTopics"]["nodes"]],
+        "language": (node.get("primaryLanguage") or {}).get("name"),
+        "stargazers_count": node.get("stargazerCount"),
+    }
+
+
+REST_REPO_FIELDS = (
+    "id", "full_name", "description", "topics", "language", "stargazers_count", "forks_count"
+)
+
+
+def _repos_from_rest(repos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep only the repo fields the app stores; REST repo objects are mostly URLs"""
+    return [{field: repo[field] for field in REST_REPO_FIELDS if field in repo} for repo in repos]
+
+
+def _stargazers_from_rest(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep only the fields the GraphQL stargazer query returns;
+    the rest of the user payload is unused"""
+    return [{"login": user["login"], "id": user["id"]} for user in users]
 
 
 class GitHubClient:
-    def __init__(self, access_token: str, redis_client: Optional[redis.Redis] = None):
+    def __init__(
+        self,
+        access_token: str,
+        redis_client: Optional[redis.Redis] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
         self.access_token = access_token
+        # ETag cache entries are per token, since /user endpoints depend on who is asking
+        self.token_key = hashlib.sha1(access_token.encode()).hexdigest()[:16]
         self.redis = redis_client
+        self.client = http_client or _get_http_client()
+        # REST rate limit state from the most recent response, for pacing between refreshes
+        self.rate_remaining: Optional[int] = None
+        self.rate_reset: Optional[int] = None
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Accept": "application/vnd.github.v3+json",
@@ -28,53 +148,174 @@ class GitHubClient:
             return None
         cached = await self.redis.get(key)
         if cached:
-            return json.loads(cached)
+            return jsonx.loads(cached)
         return None
 
     async def _set_cached(self, key: str, value: Any, ttl: int = 86400):
         if not self.redis:
             return
-        await self.redis.set(key, json.dumps(value), ex=ttl)
+        await self.redis.set(key, jsonx.dumps_bytes(value), ex=ttl)
+
+    async def _get_cached_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Look up several cache keys in one MGET round-trip"""
+        if not self.redis or not keys:
+            return {}
+        values = await self.redis.mget(keys)
+        return {key: jsonx.loads(value) for key, value in zip(keys, values) if value}
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
+    async def _set_cached_many(self, items: Dict[str, Any], ttl: int = 86400):
+        if not self.redis or not items:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, jsonx.dumps_bytes(value), ex=ttl)
+            await pipe.execute()
+
+    @retry(
+        retry=retry_if_exception(_is_retryable),
+        stop=stop_after_attempt(5),
+        wait=_retry_wait,
+        reraise=True,
+    )
     async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.request(method, url, headers=self.headers, **kwargs)
-
-            # Handle rate limiting
-            if response.status_code == 403:
-                remaining = int(response.headers.get("X-RateLimit-Remaining", 0))
-                if remaining == 0:
-                    reset_time = int(response.headers.get("X-RateLimit-Reset", 0))
-                    wait_seconds = max(reset_time - datetime.now().timestamp(), 0) + 1
-                    if wait_seconds < 3600:  # Don't wait more than an hour
-                        await asyncio.sleep(wait_seconds)
-                        return await self._request(method, url, **kwargs)
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        response = await self.client.request(method, url, headers=headers, **kwargs)
+
+        # GraphQL has its own point-based quota; pacing only tracks the REST one
+        if url != GRAPHQL_URL and "X-RateLimit-Remaining" in response.headers:
+            self.rate_remaining = int(response.headers["X-RateLimit-Remaining"])
+            self.rate_reset = int(response.headers.get("X-RateLimit-Reset", 0))
 
+        # Handle rate limiting: let the retry policy wait until the reset time
+        if response.status_code == 403:
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                reset_time = int(response.headers.get("X-RateLimit-Reset", 0))
+                wait_seconds = max(reset_time - datetime.now().timestamp(), 0) + 1
+                if wait_seconds < RATE_LIMIT_MAX_WAIT:
+                    raise RateLimited(wait_seconds)
+
+        if response.status_code != 304:  # Not Modified is handled by _get_json
             response.raise_for_status()
-            return response
+        return response
 
-    async def get_starred_repos(self, per_page: int = 100) -> List[Dict[str, Any]]:
-        """Fetch all starred repositories for the authenticated user"""
-        all_repos = []
-        page = 1
+    def throttle_delay(self) -> float:
+        """Seconds to wait before the next burst so the remaining quota lasts until the reset"""
+        if self.rate_remaining is None or self.rate_reset is None:
+            return 0.0
+        seconds_to_reset = self.rate_reset - datetime.now().timestamp()
+        return max(0.0, seconds_to_reset / max(1, self.rate_remaining))
 
-        while True:
-            url = f"{GITHUB_API_BASE}/user/starred?per_page={per_page}&page={page}"
-            response = await self._request("GET", url)
-            repos = response.json()
+    async def graphql(
+        self, query: str, variables: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Run a GraphQL query; aliases that don't exist come back as None.
+        Raises GraphQLError for any other error, since the data may then be missing or partial."""
+        response = await self._request(
+            "POST", GRAPHQL_URL, json={"query": query, "variables": variables or {}}
+        )
+        payload = response.json()
+        data = payload.get("data")
+        errors = [e for e in payload.get("errors") or [] if e.get("type") != "NOT_FOUND"]
+        if data is None or errors:
+            message = (errors or payload.get("errors") or [{}])[0].get("message", "no data")
+            raise GraphQLError(message)
+        return data
 
-            if not repos:
-                break
+    async def _get_json(
+        self, url: str, project: Callable[[Any], Any]
+    ) -> Tuple[Any, Dict[str, Dict[str, str]]]:
+        """GET a JSON resource, revalidating a stored copy with its ETag / Last-Modified.
+        A 304 costs no rate limit, so unchanged pages are served from the cache for free.
+        project trims the body to what the caller uses, and only that is stored.
+        Returns the projected body and the response's Link relations."""
+        cache_key = f"etag:v2:{self.token_key}:{url}"  # v2 entries hold projected bodies
+        stored = await self._get_cached(cache_key)
+        headers = {}
+        if stored:
+            if stored.get("etag"):
+                headers["If-None-Match"] = stored["etag"]
+            if stored.get("last_modified"):
+                headers["If-Modified-Since"] = stored["last_modified"]
 
-            all_repos.extend(repos)
-            page += 1
+        response = await self._request("GET", url, headers=headers)
+        if response.status_code == 304 and stored:
+            return stored["body"], stored["links"]
 
-            # Safety limit
-            if page > 50:
-                break
+        body = project(response.json())
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            stored = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "body": body,
+                "links": response.links,
+            }
+            await self._set_cached(cache_key, stored, ttl=ETAG_CACHE_TTL)
+        return body, response.links
 
-        return all_repos
+    async def _get_pages(
+        self,
+        url: str,
+        per_page: int,
+        max_pages: int,
+        stop_on_error: bool = False,
+        project: Callable[[Any], Any] = _repos_from_rest,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Fetch a paginated list, prefetching pages concurrently once the last page is known.
+        With stop_on_error, an HTTP error ends pagination and the pages fetched so far are kept.
+        Returns the items and whether pagination finished without an error."""
+        try:
+            all_items, links = await self._get_json(f"{url}&page=1", project)
+        except httpx.HTTPStatusError:
+            if stop_on_error:
+                return [], False
+            raise
+        all_items = list(all_items)
+        if len(all_items) < per_page:
+            return all_items, True
+
+        last_url = links.get("last", {}).get("url")
+        if not last_url:
+            # No Link header, walk the pages one at a time
+            for page in range(2, max_pages + 1):
+                try:
+                    items, _ = await self._get_json(f"{url}&page={page}", project)
+                except httpx.HTTPStatusError:
+                    if stop_on_error:
+                        return all_items, False
+                    raise
+                if not items:
+                    break
+                all_items.extend(items)
+            return all_items, True
+
+        last_page = min(int(parse_qs(urlparse(last_url).query)["page"][0]), max_pages)
+        semaphore = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+        async def fetch_page(page: int) -> List[Dict[str, Any]]:
+            async with semaphore:
+                items, _ = await self._get_json(f"{url}&page={page}", project)
+                return items
+
+        pages = await asyncio.gather(
+            *(fetch_page(page) for page in range(2, last_page + 1)),
+            return_exceptions=True,
+        )
+        for items in pages:
+            if isinstance(items, httpx.HTTPStatusError) and stop_on_error:
+                return all_items, False
+            if isinstance(items, BaseException):
+                raise items
+            all_items.extend(items)
+
+        return all_items, True
+
+    async def get_starred_repos(self, per_page: int = 100) -> List[Dict[str, Any]]:
+        """Fetch all starred repositories for the authenticated user"""
+        url = f"{GITHUB_API_BASE}/user/starred?per_page={per_page}"
+        repos, _ = await self._get_pages(url, per_page, max_pages=50)  # Safety limit
+        return repos
 
     async def get_repo_stargazers(
         self, owner: str, repo: str, sample_size: int = 100
@@ -87,13 +328,86 @@ class GitHubClient:
 
         url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/stargazers?per_page={sample_size}"
         try:
-            response = await self._request("GET", url)
-            stargazers = response.json()
+            stargazers, _ = await self._get_json(url, _stargazers_from_rest)
             await self._set_cached(cache_key, stargazers, ttl=86400)  # 24 hours
             return stargazers
         except httpx.HTTPStatusError:
             return []
 
+    async def get_many_stargazers(
+        self, repos: List[Tuple[str, str]], sample_size: int = 100
+    ) -> List[List[Dict[str, Any]]]:
+        """Fetch stargazers for several (owner, repo) pairs, in input order"""
+        keys = [f"stargazers:{owner}/{repo}" for owner, repo in repos]
+        cached = await self._get_cached_many(keys)
+        misses = [
+            (key, owner, repo) for key, (owner, repo) in zip(keys, repos) if key not in cached
+        ]
+        results = await asyncio.gather(
+            *(
+                self._fetch_stargazers(chunk, sample_size)
+                for chunk in _chunks(misses, GRAPHQL_BATCH_SIZE)
+            )
+        )
+        fetched = {key: stargazers for result in results for key, stargazers in result.items()}
+        await self._set_cached_many(fetched, ttl=86400)  # 24 hours
+
+        return [cached.get(key) or fetched.get(key) or [] for key in keys]
+
+    async def _fetch_stargazers(
+        self, repos: List[Tuple[str, str, str]], sample_size: int
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Fetch stargazers for up to GRAPHQL_BATCH_SIZE (key, owner, repo) entries in one query"""
+        params = ", ".join(f"$o{i}: String!, $n{i}: String!" for i in range(len(repos)))
+        fields = " ".join(
+            f"r{i}: repository(owner: $o{i}, name: $n{i}) "
+            f"{{ stargazers(first: {sample_size}) {{ nodes {{ login databaseId }} }} }}"
+            for i in range(len(repos))
+        )
+        variables = {}
+        for i, (_, owner, repo) in enumerate(repos):
+            variables[f"o{i}"] = owner
+            variables[f"n{i}"] = repo
+
+        try:
+            data = await self.graphql(f"query({params}) {{ {fields} }}", variables)
+        except (httpx.HTTPStatusError, RateLimited, GraphQLError):
+            # GraphQL has its own rate limit, so the REST API may still be available
+            return await self._fetch_stargazers_rest(repos, sample_size)
+
+        fetched = {}
+        for i, (key, _, _) in enumerate(repos):
+            repository = data.get(f"r{i}")
+            if repository is None:
+                continue  # Missing or private repo
+            fetched[key] = [
+                {"login": node["login"], "id": node["databaseId"]}
+                for node in repository["stargazers"]["nodes"]
+                if node
+            ]
+        return fetched
+
+    async def _fetch_stargazers_rest(
+        self, repos: List[Tuple[str, str, str]], sample_size: int
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        semaphore = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+        async def fetch(owner: str, repo: str) -> Optional[List[Dict[str, Any]]]:
+            url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/stargazers?per_page={sample_size}"
+            async with semaphore:
+                try:
+                    stargazers, _ = await self._get_json(url, _stargazers_from_rest)
+                except httpx.HTTPStatusError:
+                    return None
+            return stargazers
+
+        results = await asyncio.gather(*(fetch(owner, repo) for _, owner, repo in repos))
+        return {
+            key: stargazers
+            for (key, _, _), stargazers in zip(repos, results)
+            if stargazers is not None
+        }
+
     async def get_user_starred(
         self, username: str, per_page: int = 100, max_pages: int = 5
     ) -> List[Dict[str, Any]]:
@@ -103,25 +417,85 @@ class GitHubClient:
         if cached:
             return cached
 
-        all_repos = []
-        page = 1
+        url = f"{GITHUB_API_BASE}/users/{username}/starred?per_page={per_page}"
+        all_repos, complete = await self._get_pages(url, per_page, max_pages, stop_on_error=True)
 
-        while page <= max_pages:
-            url = f"{GITHUB_API_BASE}/users/{username}/starred?per_page={per_page}&page={page}"
-            try:
-                response = await self._request("GET", url)
-                repos = response.json()
+        # Don't pin a result cut short by an error for a week
+        if complete:
+            await self._set_cached(cache_key, all_repos, ttl=604800)  # 7 days
+        return all_repos
 
-                if not repos:
-                    break
+    async def get_many_user_starred(
+        self, usernames: List[str], per_page: int = 100, max_pages: int = 5
+    ) -> List[List[Dict[str, Any]]]:
+        """Fetch starred repos for several users, in input order,
+        batching users into GraphQL queries"""
+        keys = [f"user_starred:{username}" for username in usernames]
+        cached = await self._get_cached_many(keys)
+        misses = [(key, username) for key, username in zip(keys, usernames) if key not in cached]
 
-                all_repos.extend(repos)
-                page += 1
-            except httpx.HTTPStatusError:
+        results = await asyncio.gather(
+            *(
+                self._fetch_user_starred(chunk, per_page, max_pages)
+                for chunk in _chunks(misses, GRAPHQL_BATCH_SIZE)
+            )
+        )
+        fetched = {key: repos for result, _ in results for key, repos in result.items()}
+        complete = {key: fetched[key] for _, keys in results for key in keys}
+        await self._set_cached_many(complete, ttl=604800)  # 7 days
+
+        return [cached.get(key) or fetched.get(key) or [] for key in keys]
+
+    async def _fetch_user_starred(
+        self, users: List[Tuple[str, str]], per_page: int, max_pages: int
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], Set[str]]:
+        """Fetch starred repos for up to GRAPHQL_BATCH_SIZE (key, username) entries,
+        one query per page. Returns the results and the keys that are complete enough to cache."""
+        per_page = min(per_page, 100)  # GraphQL connection limit
+        repos: Dict[int, List[Dict[str, Any]]] = {i: [] for i in range(len(users))}
+        cursors: Dict[int, Optional[str]] = {i: None for i in range(len(users))}
+
+        for _ in range(max_pages):
+            if not cursors:
                 break
+            params = ", ".join(f"$u{i}: String!, $c{i}: String" for i in cursors)
+            fields = " ".join(
+                f"u{i}: user(login: $u{i}) {{ starredRepositories(first: {per_page}, after: $c{i}, "
+                f"orderBy: {{field: STARRED_AT, direction: DESC}}) {{ {STARRED_REPO_FIELDS} }} }}"
+                for i in cursors
+            )
+            variables = {}
+            for i, cursor in cursors.items():
+                variables[f"u{i}"] = users[i][1]
+                variables[f"c{i}"] = cursor
 
-        await self._set_cached(cache_key, all_repos, ttl=604800)  # 7 days
-        return all_repos
+            try:
+                data = await self.graphql(f"query({params}) {{ {fields} }}", variables)
+            except (httpx.HTTPStatusError, RateLimited, GraphQLError):
+                if any(repos.values()):
+                    # Keep the pages fetched so far, but only cache users that finished
+                    return (
+                        {key: repos[i] for i, (key, _) in enumerate(users)},
+                        {key for i, (key, _) in enumerate(users) if i not in cursors},
+                    )
+                # get_user_starred caches its own complete results
+                results = await asyncio.gather(
+                    *(self.get_user_starred(username, per_page, max_pages) for _, username in users)
+                )
+                return {key: result for (key, _), result in zip(users, results)}, set()
+
+            next_cursors = {}
+            for i in cursors:
+                user = data.get(f"u{i}")
+                if user is None:
+                    continue  # Unknown user
+                starred = user["starredRepositories"]
+                repos[i].extend(_repo_from_graphql(node) for node in starred["nodes"] if node)
+                if starred["pageInfo"]["hasNextPage"]:
+                    next_cursors[i] = starred["pageInfo"]["endCursor"]
+            cursors = next_cursors
+
+        return {key: repos[i] for i, (key, _) in enumerate(users)}, {key for key, _ in users}
 
     async def get_rate_limit(self) -> Dict[str, Any]:
         """Check current rate limit status"""
@@ -130,12 +504,12 @@ class GitHubClient:
         return response.json()
 
 
+@lru_cache(maxsize=256)
+def _client_for_token(access_token: str) -> GitHubClient:
+    return GitHubClient(access_token, get_redis())
+
+
 async def get_github_client(access_token: str) -> GitHubClient:
-    """Create a GitHub client with optional Redis caching"""
-    try:
-        redis_client = redis.from_url(settings.redis_url)
-        await redis_client.ping()
-    except Exception:
-        redis_client = None
-
-    return GitHubClient(access_token, redis_client)
+    """Return the client for this token; every phase of a user's refresh reuses the same one,
+    on top of the shared connection pool and Redis cache"""
+    return _client_for_token(access_token)
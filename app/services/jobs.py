@@ -0,0 +1,27 @@
+from typing import Optional
+from sqlalchemy import update, func
+
+from app.database import async_session
+from app.models import JobStatus
+
+
+async def update_job(
+    job_id: int,
+    progress: Optional[int] = None,
+    message: Optional[str] = None,
+    status: Optional[str] = None,
+):
+    """Update a JobStatus row by primary key in a single UPDATE (no SELECT)"""
+    values = {}
+    if progress is not None:
+        values["progress"] = progress
+    if message is not None:
+        values["message"] = message
+    if status is not None:
+        values["status"] = status
+        if status in ("completed", "failed"):
+            values["completed_at"] = func.now()
+
+    async with async_session() as db:
+        await db.execute(update(JobStatus).where(JobStatus.id == job_id).values(**values))
+        await db.commit()
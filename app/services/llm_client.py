@@ -1,17 +1,67 @@
 import httpx
 import json
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Any
 from tenacity import retry, stop_after_attempt, wait_exponential
+import redis.asyncio as redis
 
+from app.cache import get_redis
+from app.util import jsonx
 from app.config import get_settings
 
 settings = get_settings()
 
+_json_decoder = json.JSONDecoder()
+
+
+def _extract_json(text: str) -> Optional[Any]:
+    """Return the first complete JSON object or array embedded in text"""
+    start = 0
+    while True:
+        positions = [p for p in (text.find("{", start), text.find("[", start)) if p != -1]
+        if not positions:
+            return None
+        start = min(positions)
+        try:
+            # raw_decode balances nested brackets and quoted strings, ignoring trailing text
+            value, _ = _json_decoder.raw_decode(text, start)
+            return value
+        except json.JSONDecodeError:
+            start += 1
+
 
 class LLMClient:
-    def __init__(self, base_url: str = None, model: str = None):
+    def __init__(
+        self, base_url: str = None, model: str = None, redis_client: Optional[redis.Redis] = None
+    ):
         self.base_url = base_url or settings.llm_base_url
         self.model = model or settings.llm_model
+        self.redis = redis_client
+        self.client = httpx.AsyncClient(
+            timeout=120.0,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _get_cached(self, key: str) -> Optional[Any]:
+        if not self.redis:
+            return None
+        try:
+            cached = await self.redis.get(key)
+        except redis.RedisError:
+            return None
+        if cached:
+            return jsonx.loads(cached)
+        return None
+
+    async def _set_cached(self, key: str, value: Any, ttl: int):
+        if not self.redis:
+            return
+        try:
+            await self.redis.set(key, jsonx.dumps_bytes(value), ex=ttl)
+        except redis.RedisError:
+            pass
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=30))
     async def generate(self, prompt: str, max_tokens: int = 2000) -> str:
@@ -26,27 +76,48 @@ class LLMClient:
             "temperature": 0.7,
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            try:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
-            except (httpx.HTTPStatusError, KeyError):
-                # Try Ollama-style endpoint as fallback
-                url = f"{self.base_url}/api/generate"
-                payload = {
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                }
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                data = response.json()
-                return data.get("response", "")
-
-    async def generate_json(self, prompt: str, max_tokens: int = 2000) -> Optional[Dict[str, Any]]:
-        """Generate JSON response from LLM"""
+        try:
+            response = await self.client.post(url, json=payload)
+            response.raise_for_status()
+            data = response.json()
+            return data["choices"][0]["message"]["content"]
+        except (httpx.HTTPStatusError, KeyError):
+            # Try Ollama-style endpoint as fallback
+            url = f"{self.base_url}/api/generate"
+            payload = {
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False,
+                "options": {"num_predict": max_tokens},
+            }
+            response = await self.client.post(url, json=payload)
+            response.raise_for_status()
+            data = response.json()
+            return data.get("response", "")
+
+    async def generate_json(
+        self,
+        prompt: str,
+        max_tokens: int = 2000,
+        cache_key: Optional[str] = None,
+        cache_ttl: int = 86400,
+        validate: Optional[Callable[[Any], bool]] = None,
+    ) -> Optional[Any]:
+        """Generate JSON response (object or array) from LLM,
+        cached in Redis when cache_key is given.
+        Only replies that pass validate are cached, so a malformed reply isn't reused."""
+        is_valid = validate or (lambda value: value is not None)
+        if cache_key:
+            cached = await self._get_cached(cache_key)
+            if cached is not None and is_valid(cached):
+                return cached
+
+        result = await self._generate_json(prompt, max_tokens)
+        if cache_key and result is not None and is_valid(result):
+            await self._set_cached(cache_key, result, cache_ttl)
+        return result
+
+    async def _generate_json(self, prompt: str, max_tokens: int) -> Optional[Any]:
         full_prompt = f"{prompt}\n\nRespond ONLY with valid JSON, no other text."
 
         response = await self.generate(full_prompt, max_tokens)
@@ -60,33 +131,39 @@ class LLMClient:
             elif "```" in text:
                 text = text.split("```")[1].split("```")[0]
 
-            return json.loads(text.strip())
-        except json.JSONDecodeError:
+            return jsonx.loads(text.strip())
+        except jsonx.JSONDecodeError:
             # Try to find any JSON-like content
-            import re
-            json_match = re.search(r'\{[^{}]*\}', response, re.DOTALL)
-            if json_match:
-                try:
-                    return json.loads(json_match.group())
-                except json.JSONDecodeError:
-                    pass
-            return None
+            return _extract_json(response)
 
     async def health_check(self) -> bool:
         """Check if LLM is available"""
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                # Try health endpoint
-                response = await client.get(f"{self.base_url}/health")
-                if response.status_code == 200:
-                    return True
-
-                # Try models endpoint
-                response = await client.get(f"{self.base_url}/v1/models")
-                return response.status_code == 200
+            # Try health endpoint
+            response = await self.client.get(f"{self.base_url}/health", timeout=5.0)
+            if response.status_code == 200:
+                return True
+
+            # Try models endpoint
+            response = await self.client.get(f"{self.base_url}/v1/models", timeout=5.0)
+            return response.status_code == 200
         except Exception:
             return False
 
 
+_llm_client: Optional[LLMClient] = None
+
+
 def get_llm_client() -> LLMClient:
-    return LLMClient()
+    """Return the shared LLM client, keeping its connections open between calls"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient(redis_client=get_redis())
+    return _llm_client
+
+
+async def close_llm_client():
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
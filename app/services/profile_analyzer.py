@@ -1,10 +1,15 @@
-import json
-from typing import Optional, Dict, Any, List
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, FrozenSet, Tuple
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import async_session
 from app.models import User, StarredRepo
 from app.services.llm_client import get_llm_client
+from app.services.user_cache import invalidate_user
+from app.util import jsonx
 
 
 TASTE_PROFILE_PROMPT = """Analyze this GitHub user's starred repositories and create a developer interest profile.
@@ -30,48 +35,118 @@ Example response format:
   "summary": "A developer focused on..."
 }}"""
 
+PROFILE_CACHE_TTL = 86400  # 1 day
 
-async def build_taste_profile(user_id: int) -> Optional[Dict[str, Any]]:
+
+def format_repo_list(repos: List[StarredRepo]) -> str:
+    """Format starred repos as prompt lines (name, language, description, topics)"""
+    repo_list = []
+    for repo in repos:
+        topics = repo.topics
+        topics_str = ", ".join(topics[:5]) if topics else "no topics"
+        desc = (repo.description or "")[:100]
+        repo_list.append(f"- {repo.full_name} ({repo.language or 'unknown'}): {desc} [Topics: {topics_str}]")
+    return "\n".join(repo_list)
+
+
+async def load_profile_repos(db: AsyncSession, user_id: int) -> List[StarredRepo]:
+    """Load the starred repos a taste profile is built from"""
+    result = await db.execute(
+        select(StarredRepo)
+        .where(StarredRepo.user_id == user_id)
+        .order_by(StarredRepo.stars_count.desc())
+        .limit(100)  # Use top 100 starred repos
+    )
+    return result.scalars().all()
+
+
+async def save_taste_profile(db: AsyncSession, user_id: int, profile: Dict[str, Any]):
+    """Store a taste profile on the user record"""
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one()
+    user.taste_profile = jsonx.dumps(profile)
+    user.taste_profile_updated_at = datetime.utcnow()
+    await db.commit()
+    await invalidate_user(user_id)
+
+
+def _is_profile(profile: Any) -> bool:
+    # The JSON extractor can also return an array, e.g. from a stray bracket in the reply
+    return isinstance(profile, dict) and bool(profile)
+
+
+async def build_taste_profile(
+    user_id: int, db: Optional[AsyncSession] = None
+) -> Optional[Dict[str, Any]]:
     """Analyze user's starred repos and build a taste profile using LLM"""
+    if db is None:
+        async with async_session() as db:
+            return await build_taste_profile(user_id, db)
 
-    async with async_session() as db:
-        # Get starred repos
-        result = await db.execute(
-            select(StarredRepo)
-            .where(StarredRepo.user_id == user_id)
-            .order_by(StarredRepo.stars_count.desc())
-            .limit(100)  # Use top 100 starred repos
-        )
-        repos = result.scalars().all()
+    # Get starred repos
+    repos = await load_profile_repos(db, user_id)
 
-        if not repos:
-            return None
+    if not repos:
+        return None
 
-        # Format repos for prompt
-        repo_list = []
-        for repo in repos:
-            topics = json.loads(repo.topics) if repo.topics else []
-            topics_str = ", ".join(topics[:5]) if topics else "no topics"
-            desc = (repo.description or "")[:100]
-            repo_list.append(f"- {repo.full_name} ({repo.language or 'unknown'}): {desc} [Topics: {topics_str}]")
+    # Format repos for prompt
+    repo_text = format_repo_list(repos)
+    prompt = TASTE_PROFILE_PROMPT.format(repo_list=repo_text)
 
-        repo_text = "\n".join(repo_list)
-        prompt = TASTE_PROFILE_PROMPT.format(repo_list=repo_text)
+    # End the read transaction so the connection isn't held during the LLM call
+    await db.commit()
 
-        # Generate profile using LLM
-        llm = get_llm_client()
-        profile = await llm.generate_json(prompt)
+    # Generate profile using LLM (cached while the starred repo list is unchanged)
+    llm = get_llm_client()
+    cache_key = f"profile:{hashlib.sha256(repo_text.encode()).hexdigest()}"
+    profile = await llm.generate_json(
+        prompt, cache_key=cache_key, cache_ttl=PROFILE_CACHE_TTL, validate=_is_profile
+    )
 
-        if profile:
-            # Store in user record
-            result = await db.execute(select(User).where(User.id == user_id))
-            user = result.scalar_one()
-            user.taste_profile = json.dumps(profile)
-            from datetime import datetime
-            user.taste_profile_updated_at = datetime.utcnow()
-            await db.commit()
+    if not _is_profile(profile):
+        return None
 
-        return profile
+    # Store in user record
+    await save_taste_profile(db, user_id, profile)
+
+    return profile
+
+
+PROFILE_LIST_FIELDS = [
+    ("primary_interests", "Primary Interests"),
+    ("languages", "Preferred Languages"),
+    ("project_types", "Project Types"),
+    ("themes", "Themes"),
+]
+
+
+@lru_cache(maxsize=128)
+def _profile_to_text(items: FrozenSet[Tuple[str, Any]], markdown: bool) -> str:
+    profile = dict(items)
+    summary = profile.get("summary", "N/A")
+    if markdown:
+        lines = [f"**Summary:** {summary}", ""]
+        lines += [
+            f"**{label}:** {', '.join(profile.get(key, ()))}" for key, label in PROFILE_LIST_FIELDS
+        ]
+        return "\n".join(lines)
+
+    lines = [f"{label}: {', '.join(profile.get(key, ()))}" for key, label in PROFILE_LIST_FIELDS]
+    lines.append(f"Summary: {summary}")
+    return "\n" + "\n".join(lines) + "\n"
+
+
+def profile_to_text(profile: Dict[str, Any], markdown: bool = False) -> str:
+    """Format a taste profile as prompt text (or markdown), cached per distinct profile"""
+    try:
+        items = frozenset(
+            (key, tuple(value) if isinstance(value, list) else value)
+            for key, value in profile.items()
+        )
+    except TypeError:
+        # Nested values the LLM may have returned aren't hashable; format without the cache
+        return _profile_to_text.__wrapped__(profile.items(), markdown)
+    return _profile_to_text(items, markdown)
 
 
 def format_profile_for_display(profile: Dict[str, Any]) -> str:
@@ -79,12 +154,4 @@ def format_profile_for_display(profile: Dict[str, Any]) -> str:
     if not profile:
         return "No profile available"
 
-    lines = []
-    lines.append(f"**Summary:** {profile.get('summary', 'N/A')}")
-    lines.append("")
-    lines.append(f"**Primary Interests:** {', '.join(profile.get('primary_interests', []))}")
-    lines.append(f"**Preferred Languages:** {', '.join(profile.get('languages', []))}")
-    lines.append(f"**Project Types:** {', '.join(profile.get('project_types', []))}")
-    lines.append(f"**Themes:** {', '.join(profile.get('themes', []))}")
-
-    return "\n".join(lines)
+    return profile_to_text(profile, markdown=True)
@@ -1,113 +1,169 @@
-import json
+import asyncio
+import hashlib
 import uuid
 from typing import List, Dict, Any, Optional
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import async_session
 from app.models import User, CandidateRepo, Recommendation, StarredRepo
 from app.services.llm_client import get_llm_client
+from app.services.profile_analyzer import (
+    format_repo_list,
+    load_profile_repos,
+    profile_to_text,
+    save_taste_profile,
+)
+from app.util import jsonx
 
 
-SCORING_PROMPT = """You are evaluating whether a GitHub repository would interest a specific developer.
+SCORING_PROMPT = """You are evaluating whether GitHub repositories would interest
+a specific developer.
 
 Developer Profile:
 {profile}
 
-Repository to evaluate:
-- Name: {repo_name}
-- Description: {description}
-- Topics: {topics}
-- Language: {language}
-- Stars: {stars}
+Repositories to evaluate:
+{repo_list}
 
-Based on the developer's interests and this repository's focus, score the relevance from 0.0 to 1.0:
+Based on the developer's interests and each repository's focus, score its relevance from 0.0 to 1.0:
 - 1.0 = Perfect match, exactly what they'd love
 - 0.7-0.9 = Strong match, aligned with their interests
 - 0.4-0.6 = Moderate match, somewhat related
 - 0.1-0.3 = Weak match, tangentially related
 - 0.0 = No match
 
-Also provide a brief 1-2 sentence explanation of why this repo might (or might not) interest them.
+Also provide a brief 1-2 sentence explanation of why each repo might (or might not) interest them.
+
+Return ONLY a JSON array with one entry per repository, using its index, like this:
+[{{"index": 0, "score": 0.85, "explanation": "This library aligns with their interest in..."}}]"""
+
+FUSED_PROMPT = """You are analyzing a GitHub user's starred repositories to recommend new ones.
+
+Starred Repositories (showing name, language, and description):
+{starred_list}
+
+Candidate repositories to evaluate:
+{repo_list}
+
+First, create a profile of this developer's interests with these exact fields:
+- "primary_interests": array of top 5 main technology areas they're interested in
+- "languages": array of their preferred programming languages, ranked by frequency
+- "project_types": array of types of projects they like
+  (e.g., "frameworks", "cli-tools", "libraries")
+- "themes": array of recurring themes across repos (e.g., "machine-learning", "infrastructure")
+- "summary": a 2-3 sentence description of this developer's interests and focus areas
+
+Then score each candidate's relevance to that profile from 0.0 (no match) to 1.0 (perfect match),
+with 0.4-0.6 meaning a moderate match, and give a brief 1-2 sentence explanation for each.
 
 Return ONLY a JSON object like this:
-{{"score": 0.85, "explanation": "This library aligns with their interest in..."}}"""
+{{"profile": {{"primary_interests": [], "languages": [], "project_types": [], "themes": [],
+              "summary": "..."}},
+ "recommendations": [
+   {{"index": 0, "score": 0.85, "explanation": "This library aligns with..."}}
+ ]}}"""
 
+FUSED_MAX_CANDIDATES = 20  # Above this, profile and scoring use separate calls
+FUSED_MAX_PROMPT_CHARS = 24000  # ~6k tokens, leaving room for the response in an 8k context
+FUSED_PROFILE_TOKENS = 600
 
-async def score_candidate(
-    candidate: Dict[str, Any], profile: Dict[str, Any]
-) -> Optional[Dict[str, Any]]:
-    """Score a single candidate repo against user's taste profile"""
-    llm = get_llm_client()
+SCORING_BATCH_SIZE = 10  # Candidates per LLM call
+SCORING_CONCURRENCY = 4  # Parallel LLM calls, to avoid overwhelming a local server
+SCORING_CACHE_TTL = 604800  # 7 days
+SCORING_TOKENS_PER_CANDIDATE = 80  # {"index", "score", "explanation"} entry is ~50 tokens
+
+
+def _format_candidates(candidates: List[Dict[str, Any]]) -> str:
+    repo_list = []
+    for index, candidate in enumerate(candidates):
+        topics = candidate.get("topics", [])
+        repo_list.append(
+            f"{index}. {candidate['full_name']}\n"
+            f"   Description: {candidate.get('description') or 'No description'}\n"
+            f"   Topics: {', '.join(topics) if topics else 'No topics'}\n"
+            f"   Language: {candidate.get('language') or 'Unknown'}\n"
+            f"   Stars: {candidate.get('stars_count') or 0}"
+        )
+    return "\n".join(repo_list)
+
+
+def _parse_scores(result: Any, count: int) -> List[Optional[Dict[str, Any]]]:
+    """Map an LLM [{index, score, explanation}] array onto candidate positions"""
+    scores: List[Optional[Dict[str, Any]]] = [None] * count
+    if not isinstance(result, list):
+        return scores
+
+    for entry in result:
+        try:
+            index = int(entry["index"])
+            score = float(entry.get("score", 0))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= index < count:
+            scores[index] = {"score": score, "explanation": entry.get("explanation", "")}
+    return scores
 
-    profile_text = f"""
-Primary Interests: {', '.join(profile.get('primary_interests', []))}
-Preferred Languages: {', '.join(profile.get('languages', []))}
-Project Types: {', '.join(profile.get('project_types', []))}
-Themes: {', '.join(profile.get('themes', []))}
-Summary: {profile.get('summary', 'N/A')}
-"""
-
-    topics = candidate.get("topics", [])
-    if isinstance(topics, str):
-        topics = json.loads(topics)
-
-    prompt = SCORING_PROMPT.format(
-        profile=profile_text,
-        repo_name=candidate["full_name"],
-        description=candidate.get("description") or "No description",
-        topics=", ".join(topics) if topics else "No topics",
-        language=candidate.get("language") or "Unknown",
-        stars=candidate.get("stars_count") or 0,
+
+def _has_scores(result: Any, count: int) -> bool:
+    return any(_parse_scores(result, count))
+
+
+def _is_fused_result(result: Any) -> bool:
+    return (
+        isinstance(result, dict)
+        and isinstance(result.get("profile"), dict)
+        and bool(result["profile"])
+        and isinstance(result.get("recommendations"), list)
     )
 
-    result = await llm.generate_json(prompt)
-    if result:
-        return {
-            "score": float(result.get("score", 0)),
-            "explanation": result.get("explanation", ""),
-        }
-    return None
 
+def _candidate_dict(candidate: CandidateRepo) -> Dict[str, Any]:
+    return {
+        "github_repo_id": candidate.github_repo_id,
+        "full_name": candidate.full_name,
+        "description": candidate.description,
+        "topics": candidate.topics,
+        "language": candidate.language,
+        "stars_count": candidate.stars_count,
+        "source_count": candidate.source_count,
+        "source_users": candidate.source_users,
+    }
 
-async def generate_recommendations(user_id: int, top_n: int = 20) -> List[Dict[str, Any]]:
-    """Generate recommendations by scoring candidates against taste profile"""
 
-    async with async_session() as db:
-        # Get user's taste profile
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
+async def score_candidates_batch(
+    candidates: List[Dict[str, Any]], profile_text: str
+) -> List[Optional[Dict[str, Any]]]:
+    """Score a batch of candidate repos against user's taste profile in one LLM call"""
+    llm = get_llm_client()
 
-        if not user or not user.taste_profile:
-            return []
+    prompt = SCORING_PROMPT.format(profile=profile_text, repo_list=_format_candidates(candidates))
 
-        profile = json.loads(user.taste_profile)
+    # Same profile + same candidates in the same order gives the same prompt, so reuse its scores
+    profile_hash = hashlib.sha1(profile_text.encode()).hexdigest()
+    repo_ids = ",".join(str(candidate["github_repo_id"]) for candidate in candidates)
+    cache_key = f"score:{profile_hash}:{hashlib.sha1(repo_ids.encode()).hexdigest()}"
 
-        # Get top candidates by source_count
-        result = await db.execute(
-            select(CandidateRepo)
-            .where(CandidateRepo.user_id == user_id)
-            .order_by(CandidateRepo.source_count.desc())
-            .limit(50)
-        )
-        candidates = result.scalars().all()
+    result = await llm.generate_json(
+        prompt,
+        max_tokens=SCORING_TOKENS_PER_CANDIDATE * len(candidates),
+        cache_key=cache_key,
+        cache_ttl=SCORING_CACHE_TTL,
+        validate=lambda result: _has_scores(result, len(candidates)),
+    )
+    return _parse_scores(result, len(candidates))
 
-        if not candidates:
-            return []
 
-    # Score each candidate
+async def _store_recommendations(
+    db: AsyncSession,
+    user_id: int,
+    candidates: List[Dict[str, Any]],
+    scores: List[Optional[Dict[str, Any]]],
+    top_n: int,
+) -> List[Dict[str, Any]]:
+    """Keep the top N candidates scoring at least 0.4 and store them as a new batch"""
     scored = []
-    for candidate in candidates:
-        candidate_dict = {
-            "github_repo_id": candidate.github_repo_id,
-            "full_name": candidate.full_name,
-            "description": candidate.description,
-            "topics": candidate.topics,
-            "language": candidate.language,
-            "stars_count": candidate.stars_count,
-            "source_count": candidate.source_count,
-        }
-
-        score_result = await score_candidate(candidate_dict, profile)
+    for candidate_dict, score_result in zip(candidates, scores):
         if score_result and score_result["score"] >= 0.4:
             scored.append({
                 **candidate_dict,
@@ -122,28 +178,128 @@ async def generate_recommendations(user_id: int, top_n: int = 20) -> List[Dict[s
     # Store in database
     batch_id = str(uuid.uuid4())
 
-    async with async_session() as db:
-        for rec in top_recommendations:
-            topics = rec.get("topics")
-            if isinstance(topics, str):
-                topics_json = topics
-            else:
-                topics_json = json.dumps(topics) if topics else "[]"
-
-            recommendation = Recommendation(
-                user_id=user_id,
-                github_repo_id=rec["github_repo_id"],
-                full_name=rec["full_name"],
-                description=rec["description"],
-                topics=topics_json,
-                language=rec["language"],
-                stars_count=rec["stars_count"],
-                relevance_score=rec["relevance_score"],
-                explanation=rec["explanation"],
-                batch_id=batch_id,
-            )
-            db.add(recommendation)
-
+    if top_recommendations:
+        await db.execute(
+            insert(Recommendation),
+            [
+                {
+                    "user_id": user_id,
+                    "github_repo_id": rec["github_repo_id"],
+                    "full_name": rec["full_name"],
+                    "description": rec["description"],
+                    "topics": rec.get("topics") or [],
+                    "language": rec["language"],
+                    "stars_count": rec["stars_count"],
+                    "relevance_score": rec["relevance_score"],
+                    "explanation": rec["explanation"],
+                    "source_users": rec.get("source_users") or [],
+                    "batch_id": batch_id,
+                }
+                for rec in top_recommendations
+            ],
+        )
         await db.commit()
 
     return top_recommendations
+
+
+async def generate_recommendations(
+    user_id: int, top_n: int = 20, db: Optional[AsyncSession] = None
+) -> List[Dict[str, Any]]:
+    """Generate recommendations by scoring candidates against taste profile"""
+    if db is None:
+        async with async_session() as db:
+            return await generate_recommendations(user_id, top_n, db)
+
+    # Get user's taste profile
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+
+    if not user or not user.taste_profile:
+        return []
+
+    profile = jsonx.loads(user.taste_profile)
+
+    # Get top candidates by source_count
+    result = await db.execute(
+        select(CandidateRepo)
+        .where(CandidateRepo.user_id == user_id)
+        .order_by(CandidateRepo.source_count.desc())
+        .limit(50)
+    )
+    candidates = result.scalars().all()
+
+    if not candidates:
+        return []
+
+    # End the read transaction so the connection isn't held during the LLM calls
+    await db.commit()
+
+    # Score candidates in batches, a few LLM calls at a time
+    profile_text = profile_to_text(profile)
+    candidate_dicts = [_candidate_dict(candidate) for candidate in candidates]
+    batches = [
+        candidate_dicts[i:i + SCORING_BATCH_SIZE]
+        for i in range(0, len(candidate_dicts), SCORING_BATCH_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(SCORING_CONCURRENCY)
+
+    async def score_batch(batch: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        async with semaphore:
+            return await score_candidates_batch(batch, profile_text)
+
+    batch_scores = await asyncio.gather(*(score_batch(batch) for batch in batches))
+    scores = [score for batch in batch_scores for score in batch]
+
+    return await _store_recommendations(db, user_id, candidate_dicts, scores, top_n)
+
+
+async def generate_profile_and_recommendations(
+    user_id: int, top_n: int = 20, db: Optional[AsyncSession] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """Build the taste profile and score candidates in a single LLM call.
+
+    Returns None when the candidate list or prompt is too large for one call, or the
+    response is incomplete, so the caller can fall back to separate profile and scoring calls.
+    """
+    if db is None:
+        async with async_session() as db:
+            return await generate_profile_and_recommendations(user_id, top_n, db)
+
+    repos = await load_profile_repos(db, user_id)
+    result = await db.execute(
+        select(CandidateRepo)
+        .where(CandidateRepo.user_id == user_id)
+        .order_by(CandidateRepo.source_count.desc())
+        .limit(FUSED_MAX_CANDIDATES + 1)
+    )
+    candidates = result.scalars().all()
+
+    # End the read transaction so the connection isn't held during the LLM call
+    await db.commit()
+
+    if not repos or not candidates or len(candidates) > FUSED_MAX_CANDIDATES:
+        return None
+
+    candidate_dicts = [_candidate_dict(candidate) for candidate in candidates]
+    prompt = FUSED_PROMPT.format(
+        starred_list=format_repo_list(repos), repo_list=_format_candidates(candidate_dicts)
+    )
+    if len(prompt) > FUSED_MAX_PROMPT_CHARS:
+        return None
+
+    llm = get_llm_client()
+    result = await llm.generate_json(
+        prompt,
+        max_tokens=FUSED_PROFILE_TOKENS + SCORING_TOKENS_PER_CANDIDATE * len(candidate_dicts),
+        cache_key=f"fused:{hashlib.sha256(prompt.encode()).hexdigest()}",
+        cache_ttl=SCORING_CACHE_TTL,
+        validate=_is_fused_result,
+    )
+    if not _is_fused_result(result):
+        return None
+
+    await save_taste_profile(db, user_id, result["profile"])
+
+    scores = _parse_scores(result["recommendations"], len(candidate_dicts))
+    return await _store_recommendations(db, user_id, candidate_dicts, scores, top_n)
@@ -1,150 +1,239 @@
-import json
-from typing import List, Dict, Any, Set
-from collections import Counter
-from sqlalchemy import select, delete
+import hashlib
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, AbstractSet, FrozenSet, Optional, Tuple
+from collections import Counter, defaultdict
+from sqlalchemy import select, delete, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import async_session
-from app.models import StarredRepo, SimilarUser, CandidateRepo
+from app.models import User, StarredRepo, SimilarUser, CandidateRepo
 from app.services.github_client import get_github_client
 from app.config import get_settings
 
 settings = get_settings()
 
+# Reuse similar users across one weekly refresh, then rediscover so new stargazers get picked up
+SIMILAR_USERS_MAX_AGE = timedelta(days=8)  # Just past the weekly refresh interval
 
-async def discover_similar_users(user_id: int, access_token: str) -> List[Dict[str, Any]]:
+
+async def load_starred_repo_ids(
+    user_id: int, db: Optional[AsyncSession] = None
+) -> FrozenSet[int]:
+    """Load the GitHub ids of the user's starred repos, to exclude them from candidates"""
+    if db is None:
+        async with async_session() as db:
+            return await load_starred_repo_ids(user_id, db)
+
+    result = await db.scalars(
+        select(StarredRepo.github_repo_id).where(StarredRepo.user_id == user_id)
+    )
+    return frozenset(result)
+
+
+def starred_fingerprint(repo_ids) -> str:
+    """Order-independent hash of a set of starred repo ids"""
+    return hashlib.blake2b(
+        b",".join(str(repo_id).encode() for repo_id in sorted(repo_ids)), digest_size=16
+    ).hexdigest()
+
+
+async def discover_similar_users(
+    user_id: int, access_token: str, db: Optional[AsyncSession] = None
+) -> List[Dict[str, Any]]:
     """
     Find users with similar starring patterns by:
     1. Sampling stargazers from user's starred repos
     2. Counting overlap in starred repos
     3. Ranking by overlap percentage
     """
-    async with async_session() as db:
-        # Get user's starred repos (sample top by stars)
+    if db is None:
+        async with async_session() as db:
+            return await discover_similar_users(user_id, access_token, db)
+
+    # Get user's starred repos (sample top by stars)
+    result = await db.execute(
+        select(StarredRepo)
+        .where(StarredRepo.user_id == user_id)
+        .order_by(StarredRepo.stars_count.desc())
+        .limit(50)  # Sample from top 50 starred repos
+    )
+    starred_repos = result.scalars().all()
+
+    if not starred_repos:
+        return []
+
+    # Skip the stargazer fan-out when the sampled stars haven't changed since a recent run
+    fingerprint = starred_fingerprint(repo.github_repo_id for repo in starred_repos)
+    stored_fingerprint = await db.scalar(
+        select(User.starred_fingerprint).where(User.id == user_id)
+    )
+    if fingerprint == stored_fingerprint:
         result = await db.execute(
-            select(StarredRepo)
-            .where(StarredRepo.user_id == user_id)
-            .order_by(StarredRepo.stars_count.desc())
-            .limit(50)  # Sample from top 50 starred repos
+            select(SimilarUser)
+            .where(
+                SimilarUser.user_id == user_id,
+                SimilarUser.discovered_at >= datetime.utcnow() - SIMILAR_USERS_MAX_AGE,
+            )
+            .order_by(SimilarUser.overlap_count.desc())
         )
-        starred_repos = result.scalars().all()
-
-        if not starred_repos:
-            return []
+        existing = result.scalars().all()
+        if existing:
+            await db.commit()
+            return [
+                {
+                    "github_id": su.similar_github_id,
+                    "username": su.similar_github_username,
+                    "overlap_count": su.overlap_count,
+                    "overlap_percentage": su.overlap_percentage,
+                }
+                for su in existing
+            ]
 
-        starred_repo_ids = {repo.github_repo_id for repo in starred_repos}
+    # End the read transaction so the connection isn't held during GitHub calls
+    await db.commit()
 
     # Get stargazers from each repo
     client = await get_github_client(access_token)
-    user_star_counts: Counter = Counter()
-
-    for repo in starred_repos[:30]:  # Limit API calls
-        owner, name = repo.full_name.split("/")
-        stargazers = await client.get_repo_stargazers(owner, name, sample_size=50)
-
-        for stargazer in stargazers:
-            user_star_counts[stargazer["login"]] += 1
-
-    # Filter to users with significant overlap (starred at least 3 of the same repos)
-    similar_users = []
-    for username, overlap_count in user_star_counts.most_common(settings.max_similar_users * 2):
-        if overlap_count >= 3:
-            overlap_percentage = (overlap_count / len(starred_repos)) * 100
-            similar_users.append({
-                "username": username,
-                "overlap_count": overlap_count,
-                "overlap_percentage": round(overlap_percentage, 2),
-            })
-
-    # Limit to top N
-    similar_users = similar_users[:settings.max_similar_users]
-
-    # Store in database
-    async with async_session() as db:
-        # Clear old similar users
-        await db.execute(delete(SimilarUser).where(SimilarUser.user_id == user_id))
-
-        for su in similar_users:
-            similar_user = SimilarUser(
-                user_id=user_id,
-                similar_github_id=0,  # We don't have the ID, just username
-                similar_github_username=su["username"],
-                overlap_count=su["overlap_count"],
-                overlap_percentage=su["overlap_percentage"],
-            )
-            db.add(similar_user)
+    sampled = [tuple(repo.full_name.split("/")) for repo in starred_repos[:30]]  # Limit API calls
+    all_stargazers = [
+        stargazer
+        for stargazers in await client.get_many_stargazers(sampled, sample_size=50)
+        for stargazer in stargazers
+    ]
+    user_star_counts = Counter(stargazer["login"] for stargazer in all_stargazers)
+    github_ids = {stargazer["login"]: stargazer["id"] for stargazer in all_stargazers}
+
+    # Take the top N by overlap, keeping users with significant overlap (starred at least 3 of the
+    # same repos). most_common is sorted, so filtering after the cut loses nobody.
+    similar_users = [
+        {
+            "github_id": github_ids[username],
+            "username": username,
+            "overlap_count": overlap_count,
+            "overlap_percentage": round((overlap_count / len(starred_repos)) * 100, 2),
+        }
+        for username, overlap_count in user_star_counts.most_common(settings.max_similar_users)
+        if overlap_count >= 3
+    ]
+
+    # Store in database, replacing old similar users
+    await db.execute(delete(SimilarUser).where(SimilarUser.user_id == user_id))
+
+    if similar_users:
+        await db.execute(
+            insert(SimilarUser),
+            [
+                {
+                    "user_id": user_id,
+                    "similar_github_id": su["github_id"],
+                    "similar_github_username": su["username"],
+                    "overlap_count": su["overlap_count"],
+                    "overlap_percentage": su["overlap_percentage"],
+                }
+                for su in similar_users
+            ],
+        )
 
-        await db.commit()
+    await db.execute(
+        update(User).where(User.id == user_id).values(starred_fingerprint=fingerprint)
+    )
+    await db.commit()
 
     return similar_users
 
 
 async def gather_candidate_repos(
-    user_id: int, access_token: str, starred_repo_ids: Set[int]
+    user_id: int,
+    access_token: str,
+    starred_repo_ids: AbstractSet[int],
+    db: Optional[AsyncSession] = None,
 ) -> List[Dict[str, Any]]:
     """
     Fetch starred repos from similar users and collect as candidates
     (excluding repos the user has already starred)
     """
-    async with async_session() as db:
-        # Get similar users
-        result = await db.execute(
-            select(SimilarUser)
-            .where(SimilarUser.user_id == user_id)
-            .order_by(SimilarUser.overlap_count.desc())
-            .limit(20)
-        )
-        similar_users = result.scalars().all()
+    if db is None:
+        async with async_session() as db:
+            return await gather_candidate_repos(user_id, access_token, starred_repo_ids, db)
 
-        if not similar_users:
-            return []
+    # Get similar users
+    result = await db.execute(
+        select(SimilarUser)
+        .where(SimilarUser.user_id == user_id)
+        .order_by(SimilarUser.overlap_count.desc())
+        .limit(20)
+    )
+    similar_users = result.scalars().all()
 
-    client = await get_github_client(access_token)
-    candidate_counts: Dict[int, Dict[str, Any]] = {}
+    if not similar_users:
+        return []
 
-    for su in similar_users:
-        repos = await client.get_user_starred(su.similar_github_username, per_page=100, max_pages=2)
+    # End the read transaction so the connection isn't held during GitHub calls
+    await db.commit()
 
-        for repo in repos:
+    client = await get_github_client(access_token)
+    results = await client.get_many_user_starred(
+        [su.similar_github_username for su in similar_users], per_page=100, max_pages=2
+    )
+
+    # Aggregate into flat per-repo tables rather than one dict per candidate
+    starred_repo_ids = frozenset(starred_repo_ids)  # No copy if it's already frozen
+    source_counts: Counter = Counter()
+    source_users: Dict[int, List[str]] = defaultdict(list)
+    meta: Dict[int, Tuple[str, Optional[str], List[str], Optional[str], Optional[int]]] = {}
+    for su, repos in zip(similar_users, results):
+        # Drop repos the user already starred before aggregating
+        new_repos = [repo for repo in repos if repo["id"] not in starred_repo_ids]
+        source_counts.update(repo["id"] for repo in new_repos)
+        for repo in new_repos:
             repo_id = repo["id"]
-            if repo_id in starred_repo_ids:
-                continue  # Skip already starred
-
-            if repo_id in candidate_counts:
-                candidate_counts[repo_id]["source_count"] += 1
-                candidate_counts[repo_id]["source_users"].append(su.similar_github_username)
-            else:
-                candidate_counts[repo_id] = {
+            source_users[repo_id].append(su.similar_github_username)
+            if repo_id not in meta:
+                meta[repo_id] = (
+                    repo["full_name"],
+                    repo.get("description"),
+                    repo.get("topics", []),
+                    repo.get("language"),
+                    repo.get("stargazers_count"),
+                )
+
+    # Rank by source_count (how many similar users starred it), keeping the top 200
+    top = source_counts.most_common(200)
+
+    # Store in database, replacing old candidates
+    await db.execute(delete(CandidateRepo).where(CandidateRepo.user_id == user_id))
+
+    if top:
+        await db.execute(
+            insert(CandidateRepo),
+            [
+                {
+                    "user_id": user_id,
                     "github_repo_id": repo_id,
-                    "full_name": repo["full_name"],
-                    "description": repo.get("description"),
-                    "topics": repo.get("topics", []),
-                    "language": repo.get("language"),
-                    "stars_count": repo.get("stargazers_count"),
-                    "source_count": 1,
-                    "source_users": [su.similar_github_username],
+                    "full_name": meta[repo_id][0],
+                    "description": meta[repo_id][1],
+                    "topics": meta[repo_id][2],
+                    "language": meta[repo_id][3],
+                    "stars_count": meta[repo_id][4],
+                    "source_count": count,
+                    "source_users": source_users[repo_id],
                 }
+                for repo_id, count in top
+            ],
+        )
 
-    # Sort by source_count (how many similar users starred it)
-    candidates = sorted(candidate_counts.values(), key=lambda x: x["source_count"], reverse=True)
-
-    # Store in database
-    async with async_session() as db:
-        # Clear old candidates
-        await db.execute(delete(CandidateRepo).where(CandidateRepo.user_id == user_id))
-
-        for c in candidates[:200]:  # Keep top 200
-            candidate = CandidateRepo(
-                user_id=user_id,
-                github_repo_id=c["github_repo_id"],
-                full_name=c["full_name"],
-                description=c["description"],
-                topics=json.dumps(c["topics"]),
-                language=c["language"],
-                stars_count=c["stars_count"],
-                source_count=c["source_count"],
-            )
-            db.add(candidate)
-
-        await db.commit()
-
-    return candidates[:100]  # Return top 100
+    await db.commit()
+
+    return [  # Return top 100
+        {
+            "github_repo_id": repo_id,
+            "full_name": meta[repo_id][0],
+            "description": meta[repo_id][1],
+            "topics": meta[repo_id][2],
+            "language": meta[repo_id][3],
+            "stars_count": meta[repo_id][4],
+            "source_count": count,
+            "source_users": source_users[repo_id],
+        }
+        for repo_id, count in top[:100]
+    ]
@@ -0,0 +1,67 @@
+from typing import Any, Dict, List
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import StarredRepo
+
+STARRED_SYNC_FIELDS = (
+    "full_name", "description", "topics", "language", "stars_count", "forks_count"
+)
+
+
+async def sync_starred_repos(db: AsyncSession, user_id: int, repos: List[Dict[str, Any]]):
+    """Make the user's StarredRepo rows match the fetched stars, writing only the difference.
+    Used by both the manual sync and the scheduled refresh; the caller commits."""
+    incoming = {
+        repo["id"]: {
+            "user_id": user_id,
+            "github_repo_id": repo["id"],
+            "full_name": repo["full_name"],
+            "description": repo.get("description"),
+            "topics": repo.get("topics", []),
+            "language": repo.get("language"),
+            "stars_count": repo.get("stargazers_count"),
+            "forks_count": repo.get("forks_count"),
+        }
+        for repo in repos
+    }
+
+    result = await db.execute(
+        select(
+            StarredRepo.id,
+            StarredRepo.github_repo_id,
+            *(getattr(StarredRepo, f) for f in STARRED_SYNC_FIELDS),
+        ).where(StarredRepo.user_id == user_id)
+    )
+    existing = {row.github_repo_id: row for row in result}
+
+    # Prune repos that are no longer starred
+    removed = existing.keys() - incoming.keys()
+    if removed:
+        await db.execute(
+            delete(StarredRepo).where(
+                StarredRepo.user_id == user_id,
+                StarredRepo.github_repo_id.in_(removed),
+            )
+        )
+
+    # Insert new stars; upsert in case a concurrent sync added the same row
+    added = [row for repo_id, row in incoming.items() if repo_id not in existing]
+    if added:
+        stmt = sqlite_insert(StarredRepo)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "github_repo_id"],
+            set_={f: stmt.excluded[f] for f in STARRED_SYNC_FIELDS},
+        )
+        await db.execute(stmt, added)
+
+    # Update only rows whose metadata changed; unchanged rows keep their ids and index entries
+    changed = [
+        {"id": existing[repo_id].id, **{f: row[f] for f in STARRED_SYNC_FIELDS}}
+        for repo_id, row in incoming.items()
+        if repo_id in existing
+        and any(getattr(existing[repo_id], f) != row[f] for f in STARRED_SYNC_FIELDS)
+    ]
+    if changed:
+        await db.execute(update(StarredRepo), changed)
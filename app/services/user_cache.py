@@ -0,0 +1,71 @@
+from typing import Optional, NamedTuple
+import redis.asyncio as redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import get_redis
+from app.util import jsonx
+from app.models import User
+
+USER_CACHE_TTL = 300  # 5 minutes
+
+
+class UserView(NamedTuple):
+    """Lightweight view of the columns the web pages need from a User row"""
+    id: int
+    github_id: int
+    github_username: str
+    github_avatar_url: Optional[str]
+    has_taste_profile: bool
+
+
+async def load_user_view(db: AsyncSession, user_id: int) -> Optional[UserView]:
+    """Load a UserView without pulling tokens or the taste_profile blob"""
+    result = await db.execute(
+        select(
+            User.id,
+            User.github_id,
+            User.github_username,
+            User.github_avatar_url,
+            User.has_taste_profile.label("has_taste_profile"),
+        ).where(User.id == user_id)
+    )
+    row = result.one_or_none()
+    return UserView(*row) if row else None
+
+
+def _user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+async def get_cached_user(user_id: int) -> Optional[UserView]:
+    client = get_redis()
+    if not client:
+        return None
+    try:
+        cached = await client.get(_user_key(user_id))
+    except redis.RedisError:
+        return None
+    if cached:
+        return UserView(**jsonx.loads(cached))
+    return None
+
+
+async def cache_user(user: UserView):
+    client = get_redis()
+    if not client:
+        return
+    try:
+        await client.set(_user_key(user.id), jsonx.dumps_bytes(user._asdict()), ex=USER_CACHE_TTL)
+    except redis.RedisError:
+        pass
+
+
+async def invalidate_user(user_id: int):
+    client = get_redis()
+    if not client:
+        return
+    try:
+        await client.delete(_user_key(user_id))
+    except redis.RedisError:
+        pass
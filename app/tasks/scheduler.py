@@ -1,9 +1,10 @@
 import asyncio
 import logging
+from typing import Optional
 from datetime import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from sqlalchemy import select
+from sqlalchemy import select, insert, exists
 
 from app.config import settings
 from app.database import async_session
@@ -12,143 +13,109 @@ from app.services.github_client import get_github_client
 from app.services.profile_analyzer import build_taste_profile
 from app.services.similar_users import discover_similar_users, gather_candidate_repos
 from app.services.recommendation_engine import generate_recommendations
+from app.services.jobs import update_job
+from app.services.starred_sync import sync_starred_repos
 
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
 
+REFRESH_MAX_DELAY = 60  # Never pause a refresh slot longer than this
 
-async def refresh_user_recommendations(user_id: int):
-    """Run the complete recommendation refresh for a single user"""
+
+async def refresh_user_recommendations(user_id: int, access_token: Optional[str] = None):
+    """Run the complete recommendation refresh for a single user.
+    Callers that already selected the user's token and checked for stars pass access_token."""
     logger.info(f"Starting recommendation refresh for user {user_id}")
 
+    # One session for the whole refresh; each phase commits before the next
     async with async_session() as db:
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-
-        if not user or not user.access_token:
-            logger.warning(f"User {user_id} not found or no access token")
-            return
-
-        # Check if user has starred repos
+        if access_token is None:
+            result = await db.execute(
+                select(
+                    User.access_token,
+                    exists().where(StarredRepo.user_id == User.id).label("has_stars"),
+                ).where(User.id == user_id)
+            )
+            row = result.one_or_none()
+
+            if not row or not row.access_token:
+                logger.warning(f"User {user_id} not found or no access token")
+                return
+
+            if not row.has_stars:
+                logger.info(f"User {user_id} has no starred repos, skipping")
+                return
+
+            access_token = row.access_token
+
+        # Create job status for tracking
         result = await db.execute(
-            select(StarredRepo).where(StarredRepo.user_id == user_id).limit(1)
-        )
-        if not result.scalar_one_or_none():
-            logger.info(f"User {user_id} has no starred repos, skipping")
-            return
-
-        access_token = user.access_token
-
-    # Create job status for tracking
-    async with async_session() as db:
-        job = JobStatus(
-            user_id=user_id,
-            job_type="scheduled_refresh",
-            status="running",
-            progress=0,
-            message="Weekly refresh started",
-            started_at=datetime.utcnow(),
+            insert(JobStatus)
+            .values(
+                user_id=user_id,
+                job_type="scheduled_refresh",
+                status="running",
+                progress=0,
+                message="Weekly refresh started",
+                started_at=datetime.utcnow(),
+            )
+            .returning(JobStatus.id)
         )
-        db.add(job)
+        job_id = result.scalar_one()
         await db.commit()
-        await db.refresh(job)
-        job_id = job.id
-
-    try:
-        # Step 1: Sync stars (0-20%)
-        logger.info(f"[User {user_id}] Syncing starred repos...")
-        client = await get_github_client(access_token)
-        repos = await client.get_starred_repos()
-
-        async with async_session() as db:
-            from sqlalchemy import delete
-            from app.models import StarredRepo
-            import json
-
-            await db.execute(delete(StarredRepo).where(StarredRepo.user_id == user_id))
-
-            for repo in repos:
-                starred_repo = StarredRepo(
-                    user_id=user_id,
-                    github_repo_id=repo["id"],
-                    full_name=repo["full_name"],
-                    description=repo.get("description"),
-                    topics=json.dumps(repo.get("topics", [])),
-                    language=repo.get("language"),
-                    stars_count=repo.get("stargazers_count"),
-                    forks_count=repo.get("forks_count"),
-                )
-                db.add(starred_repo)
-            await db.commit()
 
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 20
-            job.message = f"Synced {len(repos)} starred repos"
+        try:
+            # Step 1: Sync stars (0-20%)
+            logger.info(f"[User {user_id}] Syncing starred repos...")
+            client = await get_github_client(access_token)
+            repos = await client.get_starred_repos()
+
+            await sync_starred_repos(db, user_id, repos)
+            # The synced stars are exactly what candidates must exclude
+            starred_ids = frozenset(repo["id"] for repo in repos)
             await db.commit()
 
-        # Step 2: Analyze profile (20-40%)
-        logger.info(f"[User {user_id}] Analyzing taste profile...")
-        await build_taste_profile(user_id)
+            await update_job(job_id, progress=20, message=f"Synced {len(repos)} starred repos")
 
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 40
-            job.message = "Taste profile updated"
-            await db.commit()
+            # Step 2: Analyze profile (20-40%)
+            logger.info(f"[User {user_id}] Analyzing taste profile...")
+            await build_taste_profile(user_id, db=db)
 
-        # Step 3: Find similar users (40-60%)
-        logger.info(f"[User {user_id}] Finding similar users...")
-        await discover_similar_users(user_id, access_token)
+            await update_job(job_id, progress=40, message="Taste profile updated")
 
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 60
-            job.message = "Found similar users"
-            await db.commit()
+            # Step 3: Find similar users (40-60%)
+            logger.info(f"[User {user_id}] Finding similar users...")
+            await discover_similar_users(user_id, access_token, db=db)
 
-        # Step 4: Discover candidates (60-80%)
-        logger.info(f"[User {user_id}] Discovering candidate repos...")
-        # Get user's starred repo IDs to exclude from candidates
-        async with async_session() as db:
-            result = await db.execute(select(StarredRepo.github_repo_id).where(StarredRepo.user_id == user_id))
-            starred_ids = set(r[0] for r in result.all())
-        await gather_candidate_repos(user_id, access_token, starred_ids)
-
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.progress = 80
-            job.message = "Candidate repos discovered"
-            await db.commit()
+            await update_job(job_id, progress=60, message="Found similar users")
 
-        # Step 5: Generate recommendations (80-100%)
-        logger.info(f"[User {user_id}] Generating recommendations...")
-        recommendations = await generate_recommendations(user_id)
-
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.status = "completed"
-            job.progress = 100
-            job.message = f"Generated {len(recommendations)} new recommendations"
-            job.completed_at = datetime.utcnow()
-            await db.commit()
+            # Step 4: Discover candidates (60-80%)
+            logger.info(f"[User {user_id}] Discovering candidate repos...")
+            await gather_candidate_repos(user_id, access_token, starred_ids, db=db)
 
-        logger.info(f"[User {user_id}] Weekly refresh completed with {len(recommendations)} recommendations")
+            await update_job(job_id, progress=80, message="Candidate repos discovered")
 
-    except Exception as e:
-        logger.error(f"[User {user_id}] Refresh failed: {e}")
-        async with async_session() as db:
-            result = await db.execute(select(JobStatus).where(JobStatus.id == job_id))
-            job = result.scalar_one()
-            job.status = "failed"
-            job.message = str(e)
-            job.completed_at = datetime.utcnow()
-            await db.commit()
+            # Step 5: Generate recommendations (80-100%)
+            logger.info(f"[User {user_id}] Generating recommendations...")
+            recommendations = await generate_recommendations(user_id, db=db)
+
+            await update_job(
+                job_id,
+                progress=100,
+                message=f"Generated {len(recommendations)} new recommendations",
+                status="completed",
+            )
+
+            logger.info(
+                f"[User {user_id}] Weekly refresh completed with "
+                f"{len(recommendations)} recommendations"
+            )
+
+        except Exception as e:
+            logger.error(f"[User {user_id}] Refresh failed: {e}")
+            await db.rollback()
+            await update_job(job_id, message=str(e), status="failed")
 
 
 async def weekly_refresh_all_users():
@@ -156,44 +123,41 @@ async def weekly_refresh_all_users():
     logger.info("Starting weekly recommendation refresh for all users")
 
     async with async_session() as db:
+        # One query for every user's token, skipping users with no token or no stars
         result = await db.execute(
-            select(User.id)
-            .join(StarredRepo, User.id == StarredRepo.user_id)
-            .distinct()
+            select(User.id, User.access_token).where(
+                User.access_token.is_not(None),
+                exists().where(StarredRepo.user_id == User.id),
+            )
         )
-        user_ids = [row[0] for row in result.all()]
+        users = result.all()
 
-    logger.info(f"Found {len(user_ids)} users to refresh")
+    logger.info(f"Found {len(users)} users to refresh")
 
-    for user_id in user_ids:
-        try:
-            await refresh_user_recommendations(user_id)
-            # Small delay between users to avoid rate limits
-            await asyncio.sleep(60)
-        except Exception as e:
-            logger.error(f"Failed to refresh user {user_id}: {e}")
-            continue
+    # Each user refreshes with their own token, so GitHub rate limits aren't shared
+    sem = asyncio.Semaphore(settings.refresh_concurrency)
+
+    async def _refresh_one(user_id: int, access_token: str):
+        async with sem:
+            try:
+                await refresh_user_recommendations(user_id, access_token)
+            except Exception as e:
+                logger.error(f"Failed to refresh user {user_id}: {e}")
+            finally:
+                # Pace by what's left of this token's quota before the slot is reused
+                client = await get_github_client(access_token)
+                await asyncio.sleep(min(client.throttle_delay(), REFRESH_MAX_DELAY))
+
+    await asyncio.gather(*[_refresh_one(*user) for user in users], return_exceptions=True)
 
     logger.info("Weekly refresh completed for all users")
 
 
 def setup_scheduler():
     """Configure and start the APScheduler"""
-    # Parse schedule from settings
-    day_map = {
-        "monday": 0,
-        "tuesday": 1,
-        "wednesday": 2,
-        "thursday": 3,
-        "friday": 4,
-        "saturday": 5,
-        "sunday": 6,
-    }
-
-    day_of_week = day_map.get(settings.weekly_refresh_day.lower(), 6)  # Default Sunday
+    # Settings has already normalized the day name; CronTrigger takes "sun", "mon", ...
     hour = settings.weekly_refresh_hour
-
-    trigger = CronTrigger(day_of_week=day_of_week, hour=hour, minute=0)
+    trigger = CronTrigger(day_of_week=settings.weekly_refresh_day[:3], hour=hour, minute=0)
 
     scheduler.add_job(
         weekly_refresh_all_users,
@@ -0,0 +1,11 @@
+import orjson
+
+# orjson's decode error subclasses json.JSONDecodeError, so existing handlers keep working
+JSONDecodeError = orjson.JSONDecodeError
+
+loads = orjson.loads
+dumps_bytes = orjson.dumps
+
+
+def dumps(obj) -> str:
+    return orjson.dumps(obj).decode()
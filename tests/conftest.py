@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# app.database reads DATABASE_PATH at import time, so point it at a scratch file first
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "stardiscover-test.db"))
@@ -0,0 +1,15 @@
+import pytest
+from pydantic import ValidationError
+
+from app.config import Settings
+
+
+@pytest.mark.parametrize("day", ["sunday", "Sunday", "SUN", " wed "])
+def test_weekly_refresh_day_accepts_names_and_abbreviations(day):
+    settings = Settings(weekly_refresh_day=day)
+    assert settings.weekly_refresh_day in ("sunday", "wednesday")
+
+
+def test_weekly_refresh_day_rejects_misspellings():
+    with pytest.raises(ValidationError, match="weekly_refresh_day"):
+        Settings(weekly_refresh_day="sundy")
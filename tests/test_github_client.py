@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+from app.services.github_client import GitHubClient
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for GitHubClient's caching"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value))
+
+    async def execute(self):
+        self.redis.data.update(self.commands)
+
+
+def make_client(handler, redis=None):
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return GitHubClient("token", redis_client=redis, http_client=http_client)
+
+
+def rate_limited_graphql(request):
+    # GitHub answers 200 with data null when the GraphQL rate limit is exhausted
+    return httpx.Response(
+        200, json={"data": None, "errors": [{"type": "RATE_LIMITED", "message": "limit"}]}
+    )
+
+
+def test_stargazers_fall_back_to_rest_when_graphql_is_rate_limited():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/graphql":
+            return rate_limited_graphql(request)
+        repo = request.url.path.split("/")[3]
+        return httpx.Response(200, json=[{"login": f"{repo}-fan", "id": 7, "site_admin": False}])
+
+    redis = FakeRedis()
+    client = make_client(handler, redis)
+    result = asyncio.run(client.get_many_stargazers([("octo", "one"), ("octo", "two")]))
+
+    assert result == [[{"login": "one-fan", "id": 7}], [{"login": "two-fan", "id": 7}]]
+    assert calls.count("/graphql") == 1
+    assert "/repos/octo/one/stargazers" in calls and "/repos/octo/two/stargazers" in calls
+    cached = {k: json.loads(v) for k, v in redis.data.items() if k.startswith("stargazers:")}
+    assert cached == {
+        "stargazers:octo/one": [{"login": "one-fan", "id": 7}],
+        "stargazers:octo/two": [{"login": "two-fan", "id": 7}],
+    }
+
+
+def test_user_starred_falls_back_to_rest_when_graphql_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/graphql":
+            return rate_limited_graphql(request)
+        return httpx.Response(200, json=[{"id": 1, "full_name": "octo/one", "language": "Go"}])
+
+    redis = FakeRedis()
+    client = make_client(handler, redis)
+    result = asyncio.run(client.get_many_user_starred(["alice"]))
+
+    assert result == [[{"id": 1, "full_name": "octo/one", "language": "Go"}]]
+    assert "/users/alice/starred" in calls
+    assert json.loads(redis.data["user_starred:alice"]) == result[0]
+
+
+def test_graphql_errors_are_not_cached_as_empty_results(monkeypatch):
+    def handler(request):
+        if request.url.path == "/graphql":
+            return rate_limited_graphql(request)
+        return httpx.Response(502)
+
+    # Skip the backoff between retries of the 502s
+    monkeypatch.setattr(GitHubClient._request.retry, "wait", lambda retry_state: 0)
+    redis = FakeRedis()
+    client = make_client(handler, redis)
+
+    stargazers = asyncio.run(client.get_many_stargazers([("octo", "one")]))
+    starred = asyncio.run(client.get_many_user_starred(["alice"]))
+
+    assert stargazers == [[]]
+    assert starred == [[]]
+    assert not [k for k in redis.data if k.startswith(("stargazers:", "user_starred:"))]
+
+
+def test_unchanged_pages_are_served_from_the_etag_cache():
+    requests = []
+    last_page = '<https://api.github.com/user/starred?per_page=2&page=2>; rel="last"'
+
+    def handler(request):
+        page = int(request.url.params["page"])
+        etag = f'"page-{page}"'
+        requests.append((page, request.headers.get("If-None-Match")))
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        repos = [
+            {"id": page * 10 + i, "full_name": f"octo/r{page}{i}", "owner": {"login": "octo"}}
+            for i in range(2 if page == 1 else 1)
+        ]
+        headers = {"ETag": etag}
+        if page == 1:
+            headers["Link"] = last_page
+        return httpx.Response(200, json=repos, headers=headers)
+
+    redis = FakeRedis()
+    client = make_client(handler, redis)
+    first = asyncio.run(client.get_starred_repos(per_page=2))
+    assert requests == [(1, None), (2, None)]
+
+    # Only the fields the app uses are stored
+    page_one = "https://api.github.com/user/starred?per_page=2&page=1"
+    stored = json.loads(redis.data[f"etag:v2:{client.token_key}:{page_one}"])
+    assert stored["etag"] == '"page-1"'
+    assert stored["body"] == [
+        {"id": 10, "full_name": "octo/r10"},
+        {"id": 11, "full_name": "octo/r11"},
+    ]
+
+    requests.clear()
+    second = asyncio.run(client.get_starred_repos(per_page=2))
+    assert requests == [(1, '"page-1"'), (2, '"page-2"')]
+    assert second == first == [
+        {"id": 10, "full_name": "octo/r10"},
+        {"id": 11, "full_name": "octo/r11"},
+        {"id": 20, "full_name": "octo/r20"},
+    ]
+
+
+def test_throttle_delay_tracks_only_the_rest_quota():
+    reset = int(time.time()) + 1000
+
+    def handler(request):
+        if request.url.path == "/graphql":
+            headers = {"X-RateLimit-Remaining": "1", "X-RateLimit-Reset": str(reset + 5000)}
+            return httpx.Response(200, json={"data": {"viewer": None}}, headers=headers)
+        headers = {"X-RateLimit-Remaining": "4000", "X-RateLimit-Reset": str(reset)}
+        return httpx.Response(200, json=[], headers=headers)
+
+    client = make_client(handler)
+
+    async def run():
+        await client.get_starred_repos()
+        await client.graphql("query { viewer { login } }")
+
+    asyncio.run(run())
+    assert (client.rate_remaining, client.rate_reset) == (4000, reset)
+    assert client.throttle_delay() < 1
@@ -0,0 +1,81 @@
+import asyncio
+
+from app.services.llm_client import LLMClient, _extract_json
+
+
+def test_extract_json_plain_object():
+    assert _extract_json('{"score": 0.5}') == {"score": 0.5}
+
+
+def test_extract_json_from_code_fence():
+    text = 'Here you go:\n```json\n[{"index": 0, "score": 0.9}]\n```\nHope that helps!'
+    assert _extract_json(text) == [{"index": 0, "score": 0.9}]
+
+
+def test_extract_json_ignores_trailing_text_with_brackets():
+    text = '{"summary": "likes {braces} and [brackets]"} and then {not json'
+    assert _extract_json(text) == {"summary": "likes {braces} and [brackets]"}
+
+
+def test_extract_json_skips_stray_brackets_in_prose():
+    text = 'Scores [see below] follow: {"index": 1, "score": 0.2}'
+    assert _extract_json(text) == {"index": 1, "score": 0.2}
+
+
+def test_extract_json_returns_none_without_json():
+    assert _extract_json("no json here") is None
+    assert _extract_json("{ unbalanced") is None
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+def make_client(replies):
+    client = LLMClient(base_url="http://llm.test", model="test", redis_client=FakeRedis())
+
+    async def generate(prompt, max_tokens=2000):
+        return replies.pop(0)
+
+    client.generate = generate
+    return client
+
+
+def test_generate_json_does_not_cache_invalid_replies():
+    client = make_client(["Sure! [1]", '[{"index": 0, "score": 0.8}]'])
+
+    def is_scores(result):
+        return isinstance(result, list) and isinstance(result[0], dict)
+
+    async def run():
+        first = await client.generate_json("p", cache_key="score:x", validate=is_scores)
+        assert first == [1]
+        assert client.redis.data == {}
+
+        second = await client.generate_json("p", cache_key="score:x", validate=is_scores)
+        assert second == [{"index": 0, "score": 0.8}]
+        assert "score:x" in client.redis.data
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_generate_json_ignores_invalid_cached_replies():
+    client = make_client(['{"summary": "fresh"}'])
+    client.redis.data["profile:x"] = b"[1]"
+
+    async def run():
+        result = await client.generate_json(
+            "p", cache_key="profile:x", validate=lambda result: isinstance(result, dict)
+        )
+        assert result == {"summary": "fresh"}
+        await client.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,54 @@
+from app.services.profile_analyzer import format_profile_for_display, profile_to_text
+
+PROFILE = {
+    "primary_interests": ["machine learning", "developer tools"],
+    "languages": ["Python", "Rust"],
+    "project_types": ["libraries", "CLI tools"],
+    "themes": ["performance"],
+    "summary": "Builds fast tooling for ML workflows.",
+}
+
+
+def legacy_prompt_text(profile):
+    return f"""
+Primary Interests: {', '.join(profile.get('primary_interests', []))}
+Preferred Languages: {', '.join(profile.get('languages', []))}
+Project Types: {', '.join(profile.get('project_types', []))}
+Themes: {', '.join(profile.get('themes', []))}
+Summary: {profile.get('summary', 'N/A')}
+"""
+
+
+def legacy_display_text(profile):
+    lines = []
+    lines.append(f"**Summary:** {profile.get('summary', 'N/A')}")
+    lines.append("")
+    lines.append(f"**Primary Interests:** {', '.join(profile.get('primary_interests', []))}")
+    lines.append(f"**Preferred Languages:** {', '.join(profile.get('languages', []))}")
+    lines.append(f"**Project Types:** {', '.join(profile.get('project_types', []))}")
+    lines.append(f"**Themes:** {', '.join(profile.get('themes', []))}")
+    return "\n".join(lines)
+
+
+def test_profile_to_text_matches_legacy_prompt_format():
+    assert profile_to_text(PROFILE) == legacy_prompt_text(PROFILE)
+
+
+def test_profile_to_text_matches_legacy_display_format():
+    assert profile_to_text(PROFILE, markdown=True) == legacy_display_text(PROFILE)
+    assert format_profile_for_display(PROFILE) == legacy_display_text(PROFILE)
+
+
+def test_profile_to_text_handles_missing_fields():
+    partial = {"languages": ["Go"]}
+    assert profile_to_text(partial) == legacy_prompt_text(partial)
+    assert profile_to_text(partial, markdown=True) == legacy_display_text(partial)
+
+
+def test_profile_to_text_handles_unhashable_values():
+    profile = dict(PROFILE, extra={"nested": ["value"]})
+    assert profile_to_text(profile) == legacy_prompt_text(profile)
+
+
+def test_format_profile_for_display_empty_profile():
+    assert format_profile_for_display({}) == "No profile available"
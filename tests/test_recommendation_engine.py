@@ -0,0 +1,114 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app.database import async_session, engine, init_db
+from app.models import Recommendation, User
+from app.services import recommendation_engine
+from app.services.llm_client import LLMClient
+from app.services.recommendation_engine import (
+    _parse_scores,
+    _store_recommendations,
+    score_candidates_batch,
+)
+
+
+def test_parse_scores_maps_entries_by_index():
+    result = [
+        {"index": 1, "score": 0.9, "explanation": "great"},
+        {"index": 0, "score": "0.3"},
+    ]
+    assert _parse_scores(result, 3) == [
+        {"score": 0.3, "explanation": ""},
+        {"score": 0.9, "explanation": "great"},
+        None,
+    ]
+
+
+def test_parse_scores_skips_malformed_and_out_of_range_entries():
+    result = [
+        {"score": 0.5},
+        {"index": "x", "score": 0.5},
+        {"index": 0, "score": "high"},
+        {"index": 5, "score": 0.5},
+        {"index": -1, "score": 0.5},
+        "not a dict",
+        {"index": 1, "score": 0.7, "explanation": "ok"},
+    ]
+    assert _parse_scores(result, 2) == [None, {"score": 0.7, "explanation": "ok"}]
+
+
+def test_parse_scores_rejects_non_list_results():
+    assert _parse_scores({"index": 0, "score": 1.0}, 2) == [None, None]
+    assert _parse_scores(None, 1) == [None]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+def test_score_candidates_batch_does_not_cache_unusable_replies(monkeypatch):
+    redis = FakeRedis()
+    replies = ['{"index": 0, "score": 0.9}', '[{"index": 0, "score": 0.9, "explanation": "ok"}]']
+    client = LLMClient(base_url="http://llm.test", model="test", redis_client=redis)
+
+    async def generate(prompt, max_tokens=2000):
+        return replies.pop(0)
+
+    client.generate = generate
+    monkeypatch.setattr(recommendation_engine, "get_llm_client", lambda: client)
+    candidates = [{"github_repo_id": 1, "full_name": "octo/one"}]
+
+    async def run():
+        # An object where the array was expected scores nothing and isn't cached
+        assert await score_candidates_batch(candidates, "profile") == [None]
+        assert redis.data == {}
+
+        scores = await score_candidates_batch(candidates, "profile")
+        assert scores == [{"score": 0.9, "explanation": "ok"}]
+        assert len(redis.data) == 1
+        await client.aclose()
+
+    asyncio.run(run())
+
+
+def test_store_recommendations_keeps_source_users():
+    candidates = [
+        {
+            "github_repo_id": repo_id,
+            "full_name": f"octo/r{repo_id}",
+            "description": None,
+            "topics": ["tools"],
+            "language": "Go",
+            "stars_count": 10,
+            "source_count": 2,
+            "source_users": ["alice", "bob"],
+        }
+        for repo_id in (1, 2)
+    ]
+    scores = [{"score": 0.9, "explanation": "match"}, {"score": 0.1, "explanation": "weak"}]
+
+    async def run():
+        await init_db()
+        async with async_session() as db:
+            user = User(github_id=6101, github_username="scorer", access_token="token")
+            db.add(user)
+            await db.commit()
+
+            stored = await _store_recommendations(db, user.id, candidates, scores, top_n=5)
+            assert [rec["github_repo_id"] for rec in stored] == [1]
+
+            result = await db.scalars(
+                select(Recommendation.source_users).where(Recommendation.user_id == user.id)
+            )
+            assert result.all() == [["alice", "bob"]]
+        await engine.dispose()
+
+    asyncio.run(run())
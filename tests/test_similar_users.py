@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import async_session, engine, init_db
+from app.models import SimilarUser, StarredRepo, User
+from app.services import similar_users
+from app.services.similar_users import discover_similar_users, starred_fingerprint
+
+
+def test_starred_fingerprint_ignores_order():
+    assert starred_fingerprint([3, 1, 2]) == starred_fingerprint([1, 2, 3])
+
+
+def test_starred_fingerprint_changes_with_the_set():
+    assert starred_fingerprint([1, 2, 3]) != starred_fingerprint([1, 2, 4])
+    assert starred_fingerprint([1, 2]) != starred_fingerprint([12])
+
+
+def test_starred_fingerprint_is_compact_hex():
+    fingerprint = starred_fingerprint(range(500))
+    assert len(fingerprint) == 32
+    int(fingerprint, 16)
+
+
+class GitHubCalled(Exception):
+    pass
+
+
+async def fail_github_client(access_token):
+    raise GitHubCalled
+
+
+async def seed_user(github_id, discovered_at):
+    async with async_session() as db:
+        user = User(github_id=github_id, github_username=f"user{github_id}", access_token="t")
+        db.add(user)
+        await db.flush()
+        repo_ids = [github_id * 100 + i for i in range(3)]
+        db.add_all(
+            StarredRepo(
+                user_id=user.id, github_repo_id=repo_id, full_name=f"octo/r{repo_id}", stars_count=5
+            )
+            for repo_id in repo_ids
+        )
+        db.add(
+            SimilarUser(
+                user_id=user.id,
+                similar_github_id=1,
+                similar_github_username="twin",
+                overlap_count=3,
+                overlap_percentage=100.0,
+                discovered_at=discovered_at,
+            )
+        )
+        user.starred_fingerprint = starred_fingerprint(repo_ids)
+        await db.commit()
+        return user.id
+
+
+def test_unchanged_stars_reuse_similar_users_from_last_weeks_refresh(monkeypatch):
+    monkeypatch.setattr(similar_users, "get_github_client", fail_github_client)
+
+    async def run():
+        await init_db()
+        user_id = await seed_user(5101, datetime.utcnow() - timedelta(days=7))
+        result = await discover_similar_users(user_id, "t")
+        assert [user["username"] for user in result] == ["twin"]
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_stale_similar_users_are_rediscovered(monkeypatch):
+    monkeypatch.setattr(similar_users, "get_github_client", fail_github_client)
+
+    async def run():
+        await init_db()
+        user_id = await seed_user(5102, datetime.utcnow() - timedelta(days=9))
+        try:
+            with pytest.raises(GitHubCalled):
+                await discover_similar_users(user_id, "t")
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
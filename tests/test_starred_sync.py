@@ -0,0 +1,85 @@
+import asyncio
+
+from sqlalchemy import event, select
+
+from app.database import async_session, engine, init_db
+from app.models import StarredRepo, User
+from app.services.starred_sync import sync_starred_repos
+
+GITHUB_ID = 4242
+
+
+def repo(repo_id, stars=10):
+    return {
+        "id": repo_id,
+        "full_name": f"owner/repo{repo_id}",
+        "description": "A repository",
+        "topics": ["tools"],
+        "language": "Python",
+        "stargazers_count": stars,
+        "forks_count": 1,
+    }
+
+
+async def load_rows(db, user_id):
+    result = await db.execute(
+        select(StarredRepo)
+        .where(StarredRepo.user_id == user_id)
+        .order_by(StarredRepo.github_repo_id)
+    )
+    return {row.github_repo_id: row for row in result.scalars()}
+
+
+def test_sync_starred_repos_writes_only_the_difference():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+
+    async def run():
+        await init_db()
+        async with async_session() as db:
+            user = User(github_id=GITHUB_ID, github_username="tester", access_token="token")
+            db.add(user)
+            await db.commit()
+            user_id = user.id
+
+            await sync_starred_repos(db, user_id, [repo(i) for i in range(5)])
+            await db.commit()
+            before = {repo_id: row.id for repo_id, row in (await load_rows(db, user_id)).items()}
+            assert sorted(before) == [0, 1, 2, 3, 4]
+
+            # Unstar 0 and 1, restar 5, and bump the star count on 3
+            event.listen(engine.sync_engine, "before_cursor_execute", record)
+            try:
+                incoming = [repo(2), repo(3, stars=99), repo(4), repo(5)]
+                await sync_starred_repos(db, user_id, incoming)
+                await db.commit()
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+            db.expire_all()
+            after = await load_rows(db, user_id)
+            assert sorted(after) == [2, 3, 4, 5]
+            assert after[3].stars_count == 99
+            assert after[5].full_name == "owner/repo5"
+            # Rows that survived keep their primary keys
+            assert all(after[repo_id].id == before[repo_id] for repo_id in (2, 3, 4))
+
+            writes = [s for s in statements if s in ("INSERT", "UPDATE", "DELETE")]
+            assert sorted(writes) == ["DELETE", "INSERT", "UPDATE"]
+
+            # A second sync with the same stars writes nothing
+            statements.clear()
+            event.listen(engine.sync_engine, "before_cursor_execute", record)
+            try:
+                await sync_starred_repos(db, user_id, incoming)
+                await db.commit()
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", record)
+            assert [s for s in statements if s != "SELECT"] == []
+
+        # Pooled connections are tied to this event loop
+        await engine.dispose()
+
+    asyncio.run(run())